@@ -0,0 +1,44 @@
+import os
+import sys
+import time
+from src.optimizer import OptimizerService
+
+def time_load(path, use_cache, repeats):
+    times = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        opt = OptimizerService(path, use_cache=use_cache)
+        times.append(time.perf_counter() - t0)
+    return opt, min(times), sum(times) / len(times)
+
+def bench_load(path, repeats=5):
+    print(f"Library: {path}")
+    if not os.path.exists(path):
+        print("Library file not found.")
+        return
+
+    # 1. Plain CSV path (what every cold start paid before the sidecar cache)
+    csv_opt, csv_best, csv_avg = time_load(path, False, repeats)
+
+    # 2. First load with caching enabled: parse CSV + write the sidecar
+    cache_path = csv_opt.get_cache_path()
+    if os.path.exists(cache_path):
+        os.remove(cache_path)
+    _, build_time, _ = time_load(path, True, 1)
+
+    # 3. Warm cold-starts reading the sidecar
+    cache_opt, cache_best, cache_avg = time_load(path, True, repeats)
+
+    same = (csv_opt.df_library.shape == cache_opt.df_library.shape
+            and csv_opt.library_hash == cache_opt.library_hash
+            and csv_opt.get_available_packages() == cache_opt.get_available_packages())
+
+    print(f"Rows: {len(csv_opt.df_library)}  |  Cache file: {os.path.getsize(cache_path) / 1e6:.2f} MB")
+    print(f"CSV path:    best {csv_best * 1000:8.1f} ms   avg {csv_avg * 1000:8.1f} ms")
+    print(f"Cache build: {build_time * 1000:8.1f} ms (CSV parse + sidecar write)")
+    print(f"Cache path:  best {cache_best * 1000:8.1f} ms   avg {cache_avg * 1000:8.1f} ms")
+    print(f"Speedup:     {csv_best / cache_best:.1f}x  |  Libraries identical: {same}")
+
+if __name__ == "__main__":
+    default_path = os.path.join(os.path.dirname(__file__), "data", "Murata_Unified_Library.csv")
+    bench_load(sys.argv[1] if len(sys.argv) > 1 else default_path)
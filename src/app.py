@@ -12,6 +12,7 @@ importlib.reload(optimizer)
 from optimizer import OptimizerService
 from layout_packer import pack_rectangles, render_layout
 import subprocess
+import uuid
 from datetime import datetime
 
 def get_last_updated_db():
@@ -55,8 +56,9 @@ st.set_page_config(
 @st.cache_resource
 def get_optimizer_v34():
     # Adjusted path: up one level from src, then into data
-    library_path = os.path.join(os.path.dirname(__file__), "..", "data", "Murata_Unified_Library.csv")
-    return OptimizerService(library_path)
+    data_dir = os.path.join(os.path.dirname(__file__), "..", "data")
+    library_path = os.path.join(data_dir, "Murata_Unified_Library.csv")
+    return OptimizerService(library_path, result_cache_dir=os.path.join(data_dir, "solve_cache"))
 
 optimizer = get_optimizer_v34()
 
@@ -153,13 +155,23 @@ DEFAULTS = {
     "input_max_cnt": 10,
     "input_min_temp": 85,
     "input_freq": 100.0,
-    "input_max_esr": 10.0
+    "input_max_esr": 10.0,
+    "input_exact": False,
+    "input_local_search": False,
+    "input_rank_by": "Volume"
 }
 
 for key, val in DEFAULTS.items():
     if key not in st.session_state:
         st.session_state[key] = val
 
+# Lets the optimizer re-filter this browser session's last search when only the ESR limit/ranking change
+if "solve_session" not in st.session_state:
+    st.session_state.solve_session = uuid.uuid4().hex
+
+# A rerun supersedes this session's previous script run; stop its search instead of letting it finish
+optimizer.cancel(st.session_state.solve_session)
+
 # --- SIDEBAR ---
 with st.sidebar:
     c_hdr, c_rst = st.columns([2, 1])
@@ -305,11 +317,13 @@ with st.sidebar:
     c_types, c_count = st.columns([1, 1])
     
     with c_types:
-        st.markdown("**Pool Depth**", help="Defines the maximum number of UNIQUE part numbers allowed in a single configuration. '1' uses only one type of capacitor, while 'upto 3' can mix three different values or packages to optimize for area, volume, or ESR.")
+        st.markdown("**Pool Depth**", help="Defines the maximum number of UNIQUE part numbers allowed in a single configuration. '1' uses only one type of capacitor, while 'upto 3' can mix three different values or packages to optimize for area, volume, or ESR. Deeper pools (4-6) use a bounded branch-and-bound search for large bulk rails.")
         conn_map = {
             "1": 1,
             "upto 2": 2, 
-            "upto 3": 3
+            "upto 3": 3,
+            "upto 4": 4,
+            "upto 6": 6
         }
         conn_keys = list(conn_map.keys())
         conn_type_label = st.radio("Depth", conn_keys, 
@@ -376,6 +390,13 @@ with st.sidebar:
         max_esr_mohm = st.number_input("Max System ESR (mΩ)", 
                                        step=0.1, min_value=0.1, format="%.2f", key="input_max_esr",
                                        help="Upper limit for the combined Equivalent Series Resistance of the entire parallel capacitor bank.")
+        exact = st.checkbox("Exact DP check", key="input_exact",
+                            help="Also solve min-volume and min-area exactly with a knapsack DP over every filtered part, and report whether the best stacks are proven optimal. Skipped when the DP would take more than a few seconds (very tight windows).")
+        local_search = st.checkbox("Local search (4+ part types)", key="input_local_search", disabled=conn_type < 4,
+                                   help="Pool Depth 'upto 4' or 'upto 6' only. After the exhaustive depths, mutate the best stacks found (swap parts, change counts, add or drop types) within the selected depth. Useful for large bulk-capacitance rails.")
+        rank_map = {"Volume": "Vol", "Area": "Area", "Height": "Height", "ESR": "ESR"}
+        rank_label = st.selectbox("Rank Results By", list(rank_map.keys()), key="input_rank_by",
+                                  help="Order of the returned stacks. Changing only this or Max ESR re-filters the previous search instead of running a new one.")
 
     # --- SIDEBAR FOOTER (Removed from bottom) ---
 
@@ -401,7 +422,10 @@ if selected_pkgs:
         'conn_type': conn_type,
         'packages': selected_pkgs,
         'target_freq': freq_khz * 1000.0,
-        'max_esr': max_esr_mohm / 1000.0
+        'max_esr': max_esr_mohm / 1000.0,
+        'exact': exact,
+        'local_search': 300 if local_search and conn_type >= 4 else 0,
+        'rank_by': rank_map[rank_label]
     }
 
 if 'last_run_constraints' not in st.session_state:
@@ -494,7 +518,7 @@ def render_results_table(df_to_render, placeholder):
         "Configuration": st.column_config.TextColumn("Configuration", width="medium"), 
     }
     
-    MAX_DEPTH = 3
+    MAX_DEPTH = 6
     for k in range(1, MAX_DEPTH + 1):
         # Only configure if column exists
         if f"Part {k}" in df_to_render.columns:
@@ -514,6 +538,104 @@ def render_results_table(df_to_render, placeholder):
         height=600
     )
 
+# Helper for superscripts
+def to_superscript(n):
+    # 0-9 and +
+    mapping = str.maketrans("0123456789+", "⁰¹²³⁴⁵⁶⁷⁸⁹⁺")
+    return str(n).translate(mapping)
+
+# Display row (without Rank) for one solution stack; formatted once per stack as it arrives
+def format_result_row(r):
+    row = {
+        'Vol': r['Vol'], 
+        'Area': r.get('Area', 0),
+        'Height': r.get('Height', 0),
+        'Capacitance': r['Cap'] * 1e6,
+        'ESR': r.get('ESR', 0) * 1000.0,
+        'Configuration': r['BOM'] # Clean BOM without "Alts" text
+    }
+
+    # Gather all alternatives for counting
+    primary_parts = r.get('Parts', [])
+    # Robustness: Handle if Alts are strings (old cache) or dicts (new)
+    alts_raw = r.get('Alts', [])
+    alts_list = []
+    if alts_raw:
+        if isinstance(alts_raw[0], list):
+            alts_list = alts_raw
+        else:
+            # Old format (strings) or empty
+            # Cannot properly count unique parts from strings easily without parsing
+            # Just ignore alts for exponent if data is stale, to prevent crash
+            alts_list = []
+
+    all_stacks = [primary_parts] + alts_list
+
+    # Ensure primary parts are sorted (Area Desc) - matching optimizer logic
+    # Safety check: ensure p has L/W
+    primary_parts.sort(key=lambda x: (-(x.get('L',0) * x.get('W',0)), x.get('part','')))
+
+    for idx, p in enumerate(primary_parts):
+        if idx >= 6: break
+
+        p_name = p['part']
+        cnt = p['count']
+
+        # Count unique PART NUMBERS for this slot
+        slot_alts = set()
+        for stack in all_stacks:
+            if idx < len(stack):
+                # Sort stack to ensure alignment
+                try:
+                    s_sorted = sorted(stack, key=lambda x: (-(x.get('L',0) * x.get('W',0)), x.get('part','')))
+                    slot_alts.add(s_sorted[idx]['part'])
+                except:
+                    # Fallback if stack data is malformed
+                    pass
+
+        num_unique = len(slot_alts)
+        # User Request: "reduce the counts by 1" -> Show number of ADDITIONAL alternatives
+        # 1 Option -> 0 Add'l -> Show nothing
+        # 2 Options -> 1 Add'l -> Show ¹
+
+        additional_alts = num_unique - 1
+        exp_str = ""
+        if additional_alts > 0:
+            exp_str = to_superscript(f"+{additional_alts}")
+
+        url = f"https://www.digikey.com/en/products/result?keywords={p_name}"
+
+        row[f"P{idx+1}"] = f"{cnt}x {p_name}{exp_str}"
+        row[f"L{idx+1}"] = url
+
+    return row
+
+# Ranked display table from formatted rows, with Part/Buy columns up to the run depth
+def build_display_table(rows, run_depth):
+    df_disp = pd.DataFrame([dict(row, Rank=i + 1) for i, row in enumerate(rows)])
+
+    # Fill missing columns up to requested depth
+    for k in range(1, run_depth + 1):
+        if f"P{k}" not in df_disp.columns:
+            df_disp[f"P{k}"] = ""
+            df_disp[f"L{k}"] = None
+    
+    # Prepare for display
+    ordered_cols = ['Rank', 'Capacitance', 'Vol', 'Area', 'Height', 'ESR', 'Configuration']
+    new_columns = [
+        "Rank", "Derated Cap\n(µF)", "Vol\n(mm³)", "Area (flat)\n(mm²)", 
+        "Height (flat)\n(mm)", "ESR\n(mΩ)", "Configuration"
+    ]
+    
+    # Dynamically add Part/Buy columns
+    for k in range(1, run_depth + 1):
+        ordered_cols.extend([f"P{k}", f"L{k}"])
+        new_columns.extend([f"Part {k}", f"Buy {k}"])
+
+    df_disp = df_disp[ordered_cols]
+    df_disp.columns = new_columns
+    return df_disp
+
 # Table placeholder
 table_placeholder = st.empty()
 
@@ -533,146 +655,62 @@ if run_btn:
     if not selected_pkgs:
         st.error("Select at least one package.")
     else:
-        gen = optimizer.solve_generator(constraints)
+        gen = optimizer.solve_generator(constraints, session_id=st.session_state.solve_session)
         
         final_count = 0
         found_any = False
-        
-        try:
-            for val in gen:
-                # Defensive unpacking: Handle both legacy (2) and new (3) tuple formats
-                if len(val) == 3:
-                    prog, partial_sols, status = val
-                elif len(val) == 2:
-                    prog, partial_sols = val
-                    status = f"Processing... ({prog}%)"
-                else:
-                    continue # Skip invalid usage
-
-                progress_container.progress(prog, text=status)
-                
-                if partial_sols:
-                    if 'error' in partial_sols[0]:
-                        st.error(f"Solver Error: {partial_sols[0]['error']}")
-                        break
-
-                    found_any = True
-                    df_raw = pd.DataFrame(partial_sols)
-                    df_raw = df_raw.sort_values(by='Vol').head(50)
-                    
-                    # Store raw solutions for layout visualization
-                    st.session_state.last_results = df_raw.to_dict('records')
-                    
-                    rows = []
-                    
-                    # Helper for superscripts
-                    def to_superscript(n):
-                        # 0-9 and +
-                        mapping = str.maketrans("0123456789+", "⁰¹²³⁴⁵⁶⁷⁸⁹⁺")
-                        return str(n).translate(mapping)
-
-                    for i, r in enumerate(df_raw.to_dict('records')):
-                        row = {
-                            'Rank': i + 1,
-                            'Vol': r['Vol'], 
-                            'Area': r.get('Area', 0),
-                            'Height': r.get('Height', 0),
-                            'Capacitance': r['Cap'] * 1e6,
-                            'ESR': r.get('ESR', 0) * 1000.0,
-                            'Configuration': r['BOM'] # Clean BOM without "Alts" text
-                        }
-                        
-                        # Gather all alternatives for counting
-                        primary_parts = r.get('Parts', [])
-                        # Robustness: Handle if Alts are strings (old cache) or dicts (new)
-                        alts_raw = r.get('Alts', [])
-                        alts_list = []
-                        if alts_raw:
-                            if isinstance(alts_raw[0], list):
-                                alts_list = alts_raw
-                            else:
-                                # Old format (strings) or empty
-                                # Cannot properly count unique parts from strings easily without parsing
-                                # Just ignore alts for exponent if data is stale, to prevent crash
-                                alts_list = []
-                        
-                        all_stacks = [primary_parts] + alts_list
-                        
-                        # Ensure primary parts are sorted (Area Desc) - matching optimizer logic
-                        # Safety check: ensure p has L/W
-                        primary_parts.sort(key=lambda x: (-(x.get('L',0) * x.get('W',0)), x.get('part','')))
-                        
-                        for idx, p in enumerate(primary_parts):
-                            if idx >= 3: break
-                            
-                            p_name = p['part']
-                            cnt = p['count']
-                            
-                            # Count unique PART NUMBERS for this slot
-                            slot_alts = set()
-                            for stack in all_stacks:
-                                if idx < len(stack):
-                                    # Sort stack to ensure alignment
-                                    try:
-                                        s_sorted = sorted(stack, key=lambda x: (-(x.get('L',0) * x.get('W',0)), x.get('part','')))
-                                        slot_alts.add(s_sorted[idx]['part'])
-                                    except:
-                                        # Fallback if stack data is malformed
-                                        pass
-                            
-                            num_unique = len(slot_alts)
-                            # User Request: "reduce the counts by 1" -> Show number of ADDITIONAL alternatives
-                            # 1 Option -> 0 Add'l -> Show nothing
-                            # 2 Options -> 1 Add'l -> Show ¹
-                            
-                            additional_alts = num_unique - 1
-                            exp_str = ""
-                            if additional_alts > 0:
-                                exp_str = to_superscript(f"+{additional_alts}")
-                            
-                            url = f"https://www.digikey.com/en/products/result?keywords={p_name}"
-                            
-                            row[f"P{idx+1}"] = f"{cnt}x {p_name}{exp_str}"
-                            row[f"L{idx+1}"] = url
-                        
-                        rows.append(row)
-                    
-                    df_disp = pd.DataFrame(rows)
-                    final_count = len(df_disp)
-                    
-                    # Fill missing
-                    
-                    # Determine depth from constraints
-                    run_depth = st.session_state.last_run_constraints.get('conn_type', 3)
-
-                    # Fill missing columns up to requested depth
-                    for k in range(1, run_depth + 1):
-                        if f"P{k}" not in df_disp.columns:
-                            df_disp[f"P{k}"] = ""
-                            df_disp[f"L{k}"] = None
-                    
-                    # Prepare for display
-                    ordered_cols = ['Rank', 'Capacitance', 'Vol', 'Area', 'Height', 'ESR', 'Configuration']
-                    new_columns = [
-                        "Rank", "Derated Cap\n(µF)", "Vol\n(mm³)", "Area (flat)\n(mm²)", 
-                        "Height (flat)\n(mm)", "ESR\n(mΩ)", "Configuration"
-                    ]
-                    
-                    # Dynamically add Part/Buy columns
-                    for k in range(1, run_depth + 1):
-                        ordered_cols.extend([f"P{k}", f"L{k}"])
-                        new_columns.extend([f"Part {k}", f"Buy {k}"])
 
-                    df_disp = df_disp[ordered_cols]
-                    df_disp.columns = new_columns
+        # Determine depth from constraints
+        run_depth = st.session_state.last_run_constraints.get('conn_type', 3)
+
+        # Best stacks so far, patched from the solver's topk deltas by key
+        live_stacks = {}
+        live_rows = {}
 
-                    # Store for persistence
-                    st.session_state.last_df_disp = df_disp
-                    st.session_state.found_any = True
-                    st.session_state.final_count = final_count
+        def show_results(stacks, rows):
+            df_disp = build_display_table(rows, run_depth)
 
-                    # Render
-                    render_results_table(df_disp, table_placeholder)
+            # Store raw solutions for layout visualization, display table for persistence
+            st.session_state.last_results = stacks
+            st.session_state.last_df_disp = df_disp
+            st.session_state.found_any = True
+            st.session_state.final_count = len(df_disp)
+
+            # Render
+            render_results_table(df_disp, table_placeholder)
+            return len(df_disp)
+
+        try:
+            for event in gen:
+                kind = event['type']
+                if kind == 'progress':
+                    progress_container.progress(event['progress'], text=event['status'])
+
+                elif kind == 'topk':
+                    for key in event['removed']:
+                        del live_stacks[key], live_rows[key]
+                    for entry in event['added']:
+                        live_stacks[entry['key']] = entry['stack']
+                        live_rows[entry['key']] = format_result_row(entry['stack'])
+                    if event['order']:
+                        found_any = True
+                        final_count = show_results([live_stacks[k] for k in event['order']],
+                                                   [live_rows[k] for k in event['order']])
+
+                elif kind == 'result':
+                    progress_container.progress(100, text=event['status'])
+                    # Already ranked by the selected objective and limited by the optimizer
+                    results = event['results']
+                    if results:
+                        found_any = True
+                        final_count = show_results(results, [format_result_row(r) for r in results])
+
+                elif kind == 'error':
+                    st.error(f"Solver Error: {event['status']}")
+                    break
+
+                elif kind == 'cancelled':
+                    break
         except Exception as e:
             st.error(f"Search Execution Failed: {str(e)}")
             import traceback
@@ -780,10 +818,12 @@ if 'last_results' in st.session_state and st.session_state.last_results:
     st.markdown("---")
     db_date = get_last_updated_db()
     web_date = get_last_updated_webapp()
+    cancel_stats = optimizer.cancel_stats()
     st.markdown(f"""
     <div style="font-size: 11px; color: #888; text-align: center; padding-top: 10px;">
         <div style="margin-bottom: 5px; font-weight: 600;">Made with μεράκι by Nagesh Patle</div>
         <div><b>Last Updated (Murata Database):</b> {db_date}</div>
         <div><b>Last Updated (Website):</b> {web_date}</div>
+        <div><b>Superseded Searches Cancelled:</b> {cancel_stats['cancelled_jobs']} (~{cancel_stats['cpu_saved_s']:.1f} CPU-s saved)</div>
     </div>
     """, unsafe_allow_html=True)
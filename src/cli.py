@@ -0,0 +1,157 @@
+"""
+Headless batch runner for the optimizer.
+
+Reads one constraints object per line (JSON Lines) from a file or stdin, solves them on a
+process pool whose workers each load the library once, and writes one JSON result per line
+as solves finish:
+
+    python src/cli.py rails.jsonl -o results.jsonl -j 8
+    cat rails.jsonl | python src/cli.py --ordered > results.jsonl
+
+Constraint objects use the same keys as OptimizerService.solve_generator(); an optional "id"
+is echoed back. Each output line is
+    {"index", "id", "ok", "status", "partial", "results", "elapsed_ms"}
+where index counts non-blank input lines from 0; lines that are not JSON objects come back
+with ok false and an "Error: ..." status.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+sys.path.append(os.path.dirname(__file__))
+from optimizer import OptimizerService
+
+DEFAULT_LIBRARY = os.path.join(os.path.dirname(__file__), "..", "data", "Murata_Unified_Library.csv")
+
+# Per-process optimizer, loaded once by the pool initializer
+_SERVICE = None
+
+
+def _init_worker(library_path, cache_dir):
+    global _SERVICE
+    _SERVICE = OptimizerService(library_path, result_cache_dir=cache_dir)
+
+
+def _solve_line(index, line):
+    """Solve one input line; returns the output record."""
+    try:
+        constraints = json.loads(line)
+        if not isinstance(constraints, dict):
+            raise ValueError("expected a JSON object")
+    except ValueError as e:
+        return {'index': index, 'id': None, 'ok': False, 'status': f"Error: invalid input line ({e}).",
+                'partial': False, 'results': [], 'elapsed_ms': 0.0}
+
+    rail_id = constraints.pop('id', None)
+    # Parallelism is across lines; a pool worker does not fork shard pools of its own
+    constraints['workers'] = 1
+    t0 = time.perf_counter()
+    last = {'type': 'error', 'status': "Error: no result."}
+    try:
+        for last in _SERVICE.solve_generator(constraints):
+            pass
+    except Exception as e:
+        last = {'type': 'error', 'status': f"Error: {type(e).__name__}: {e}"}
+    return {
+        'index': index, 'id': rail_id, 'ok': last['type'] == 'result', 'status': last['status'],
+        'partial': last.get('partial', False), 'results': last.get('results', []),
+        'elapsed_ms': round((time.perf_counter() - t0) * 1000.0, 1)
+    }
+
+
+def _lines(stream):
+    """(index, line) for the non-blank lines of stream, numbered from 0."""
+    index = 0
+    for line in stream:
+        if line.strip():
+            yield index, line
+            index += 1
+
+
+def run(stream, out, jobs, library_path, cache_dir=None, ordered=False):
+    """
+    Solve every line of stream and write the results to out. Returns (lines, failures).
+
+    At most 4 * jobs lines are in flight, so arbitrarily long inputs stream through in
+    bounded memory. With ordered, results are written in input order instead of as they finish,
+    and finished lines waiting behind a slow one count toward that limit.
+    """
+    count = failures = 0
+
+    def emit(record):
+        nonlocal count, failures
+        count += 1
+        failures += not record['ok']
+        out.write(json.dumps(record, default=lambda o: o.item() if hasattr(o, 'item') else str(o)) + "\n")
+        out.flush()
+
+    if jobs <= 1:
+        _init_worker(library_path, cache_dir)
+        for index, line in _lines(stream):
+            emit(_solve_line(index, line))
+        return count, failures
+
+    pool = ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=(library_path, cache_dir))
+    try:
+        pending = deque()  # submission order, for --ordered: running plus finished but not yet written
+        running = set()
+        in_flight = pending if ordered else running
+        lines = _lines(stream)
+        exhausted = False
+        while True:
+            while not exhausted and len(in_flight) < 4 * jobs:
+                item = next(lines, None)
+                if item is None:
+                    exhausted = True
+                    break
+                fut = pool.submit(_solve_line, *item)
+                running.add(fut)
+                if ordered:
+                    pending.append(fut)
+            if not running:
+                break
+            done = wait(running, return_when=FIRST_COMPLETED).done
+            running -= done
+            if ordered:
+                while pending and pending[0].done():
+                    emit(pending.popleft().result())
+            else:
+                for fut in done:
+                    emit(fut.result())
+        return count, failures
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Solve capacitor-bank constraints from JSON Lines.")
+    parser.add_argument("input", nargs="?", default="-", help="JSON Lines file of constraint objects ('-' for stdin)")
+    parser.add_argument("-o", "--output", default="-", help="where to write JSON Lines results ('-' for stdout)")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1, help="worker processes (default: CPU count)")
+    parser.add_argument("--library", default=DEFAULT_LIBRARY, help="unified library CSV")
+    parser.add_argument("--cache-dir", default=None, help="on-disk result cache shared by the workers")
+    parser.add_argument("--ordered", action="store_true", help="write results in input order")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.library):
+        parser.error(f"library not found: {args.library}")
+
+    src = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    t0 = time.perf_counter()
+    try:
+        count, failures = run(src, out, args.jobs, args.library, args.cache_dir, args.ordered)
+    finally:
+        if src is not sys.stdin: src.close()
+        if out is not sys.stdout: out.close()
+    print(f"Solved {count} constraint sets ({failures} failed) in {time.perf_counter() - t0:.1f} s "
+          f"with {max(1, args.jobs)} worker(s).", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,11 +2,1344 @@ import pandas as pd
 import numpy as np
 import re
 import os
+import json
+import hashlib
+import time
+import threading
+import itertools
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+
+def _parse_vector(text):
+    """Decode a bracketed curve cell like '[0 1 2.5]' into a float array."""
+    s = str(text).replace('[', '').replace(']', '').strip()
+    if not s: return np.empty(0)
+    try:
+        return np.fromstring(s, sep=' ')
+    except ValueError:
+        return np.empty(0)
+
+
+def _interp_ragged(x, y, offsets, q):
+    """
+    Evaluate np.interp(q, x[seg], y[seg]) for every segment of a ragged store in one pass.
+
+    Knots must be ascending within a segment (data_merger sorts every curve). Mirrors
+    numpy's scalar rules (end clamping, exact-knot hits, NaN slope fallback) so the
+    result matches the per-part call bit for bit. Empty segments return NaN. q is one
+    query for every segment, or an array with one query per segment.
+    """
+    starts, ends = offsets[:-1], offsets[1:]
+    out = np.full(len(starts), np.nan)
+    has = ends > starts
+    if not has.any(): return out
+
+    # Index of the last knot <= q inside each segment (first-1 when q is left of the curve)
+    le = np.zeros(len(x) + 1, dtype=np.int64)
+    if np.ndim(q):
+        q = np.asarray(q, dtype=float)
+        np.cumsum(x <= np.repeat(q, ends - starts), out=le[1:])
+    else:
+        np.cumsum(x <= q, out=le[1:])
+    first, last = starts[has], ends[has] - 1
+    j = first + (le[ends[has]] - le[first]) - 1
+
+    res = np.empty(len(first))
+    left = j < first
+    right = j >= last
+    res[left] = y[first[left]]
+    res[right] = y[last[right]]
+
+    mid = ~(left | right)
+    jm = j[mid]
+    if np.ndim(q):
+        q = q[has][mid]
+    x0, x1, y0, y1 = x[jm], x[jm + 1], y[jm], y[jm + 1]
+    with np.errstate(all='ignore'):
+        slope = (y1 - y0) / (x1 - x0)
+        r = slope * (q - x0) + y0
+        r = np.where(np.isnan(r), slope * (q - x1) + y1, r)
+        r = np.where(np.isnan(r) & (y0 == y1), y0, r)
+    res[mid] = np.where(x0 == q, y0, r)
+
+    out[has] = res
+    return out
+
+
+def _depth2_block(C, E, i, win, max_n, max_sys_esr):
+    """
+    All feasible (j, nA, nB) stacks pairing part i with every part j > i, in one NumPy pass.
+
+    Equivalent to the nested j / nA / nB loops: for each (j, nA) cell the feasible nB range
+    is solved directly, the grid is expanded only over those ranges, and the capacitance
+    window and parallel-ESR limit are applied as masks. Rows come back in loop order
+    (j, then nA, then nB) as arrays: j, nA, nB, total capacitance, system ESR.
+    """
+    empty = (np.empty(0, dtype=np.int64),) * 3 + (np.empty(0),) * 2
+    cA, eA = C[i], E[i]
+    nA = np.arange(1, max_n)
+    nA = nA[win[1] - nA*cA > 0] # Larger nA overshoot the window on their own
+    J = np.arange(i + 1, len(C))
+    if len(nA) == 0 or len(J) == 0: return empty
+
+    rem_min = win[0] - nA*cA
+    rem_max = win[1] - nA*cA
+    cB = C[J][:, None]
+    lo = np.maximum(1, np.ceil(np.maximum(0, rem_min) / cB))
+    hi = np.minimum(np.floor(rem_max / cB), max_n - nA) # Count limit caps nB directly
+    lo = np.minimum(lo, max_n + 1).astype(np.int64)
+    hi = hi.astype(np.int64)
+    cnt = np.maximum(hi - lo + 1, 0).ravel()
+    total = int(cnt.sum())
+    if total == 0: return empty
+
+    # Expand every (j, nA) cell into its nB range
+    cell = np.repeat(np.arange(len(cnt)), cnt)
+    start = np.cumsum(cnt) - cnt
+    nB = lo.ravel()[cell] + (np.arange(total) - start[cell])
+    j = J[cell // len(nA)]
+    nA = nA[cell % len(nA)]
+
+    tot_c = nA*cA + nB*C[j]
+    ok = (win[0] <= tot_c) & (tot_c <= win[1])
+    j, nA, nB, tot_c = j[ok], nA[ok], nB[ok], tot_c[ok]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        gA = np.where(eA > 0, nA / eA, 999999)
+        eB = E[j]
+        gB = np.where(eB > 0, nB / eB, 999999)
+        sys_esr = 1.0 / (gA + gB)
+    ok = sys_esr <= max_sys_esr
+    return j[ok], nA[ok], nB[ok], tot_c[ok], sys_esr[ok]
+
+
+def _single_multiples(C, V, E, max_cap, max_count):
+    """
+    Every single-part multiple (part k, n, n*C, n*V, n/E) below max_cap, sorted by capacitance.
+
+    This is the "right half" of the depth-3 meet-in-the-middle search: a pair's complement
+    is a contiguous slice of this table, found with two binary searches.
+    """
+    k = np.repeat(np.arange(len(C)), max_count)
+    n = np.tile(np.arange(1, max_count + 1), len(C))
+    c = n * C[k]
+    ok = c < max_cap
+    k, n, c = k[ok], n[ok], c[ok]
+    order = np.argsort(c, kind='stable')
+    k, n, c = k[order], n[order], c[order]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        g = np.where(E[k] > 0, n / E[k], 999999)
+    return {'k': k, 'n': n, 'c': c, 'v': n * V[k], 'g': g}
+
+
+def _depth3_block(ing, singles, i, win, max_n, max_sys_esr, vol_cap=np.inf):
+    """
+    All feasible A+B+C stacks with A = part i and i < j < k, via meet-in-the-middle.
+
+    The (j, nA, nB) partial sums are enumerated as arrays, and each one's complement
+    window [win0 - s, win1 - s] is located in the sorted single-multiple table with
+    np.searchsorted, so the third part is never looped over. Stacks whose volume reaches
+    vol_cap are dropped. Returns arrays j, nA, nB, k, nC, total cap, system ESR, volume.
+    """
+    C, V, E = ing['C'], ing['V'], ing['E']
+    empty = tuple(np.empty(0, dtype=np.int64) for _ in range(5)) + tuple(np.empty(0) for _ in range(3))
+    J = np.arange(i + 1, len(C))
+    if len(J) == 0 or len(singles['c']) == 0 or max_n < 3: return empty
+
+    # Left half: (j, nA, nB) with room for at least one more capacitor
+    counts = np.arange(1, max_n - 1)
+    j = np.repeat(J, len(counts) ** 2)
+    nA = np.tile(np.repeat(counts, len(counts)), len(J))
+    nB = np.tile(counts, len(J) * len(counts))
+    s = nA*C[i] + nB*C[j]
+    v_ab = nA*V[i] + nB*V[j]
+    ok = (nA + nB <= max_n - 1) & (s < win[1]) & (v_ab + singles['v'].min() < vol_cap)
+    j, nA, nB, s, v_ab = j[ok], nA[ok], nB[ok], s[ok], v_ab[ok]
+    if len(s) == 0: return empty
+
+    # Right half: binary search the complement window in the sorted multiples
+    lo = np.searchsorted(singles['c'], win[0] - s, side='left')
+    hi = np.searchsorted(singles['c'], win[1] - s, side='right')
+    cnt = np.maximum(hi - lo, 0)
+    total = int(cnt.sum())
+    if total == 0: return empty
+    row = np.repeat(np.arange(len(s)), cnt)
+    start = np.cumsum(cnt) - cnt
+    q = lo[row] + (np.arange(total) - start[row])
+
+    j, nA, nB, s, v_ab = j[row], nA[row], nB[row], s[row], v_ab[row]
+    k, nC = singles['k'][q], singles['n'][q]
+    tot = s + singles['c'][q]
+    vol = v_ab + singles['v'][q]
+    ok = (k > j) & (nA + nB + nC <= max_n) & (win[0] <= tot) & (tot <= win[1]) & (vol < vol_cap)
+    j, nA, nB, k, nC, tot, vol, q = j[ok], nA[ok], nB[ok], k[ok], nC[ok], tot[ok], vol[ok], q[ok]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        gA = np.where(E[i] > 0, nA / E[i], 999999)
+        gB = np.where(E[j] > 0, nB / E[j], 999999)
+        sys_esr = 1.0 / (gA + gB + singles['g'][q])
+    ok = sys_esr <= max_sys_esr
+    return j[ok], nA[ok], nB[ok], k[ok], nC[ok], tot[ok], sys_esr[ok], vol[ok]
+
+
+def _search_order(df, win, max_n):
+    """
+    Candidate rows most promising first: volumetric density scaled by how much of the window
+    max_n copies of the part can cover (nothing when a single copy already overshoots it).
+    The pair and triple scans pair each row with the rows after it, so a search cut short
+    has covered every stack built on its best parts.
+    """
+    C = df['C'].to_numpy(dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fit = np.minimum(1.0, max_n * C / win[0]) if win[0] > 0 else np.ones(len(C))
+    score = np.nan_to_num(df['D'].to_numpy(dtype=float) * np.where(C <= win[1], fit, 0.0), nan=0.0)
+    return df.iloc[np.argsort(-score, kind='stable')]
+
+
+def _pick_candidates(ranked, sizes, win, max_n):
+    """
+    The top (density, capacitance, smallest volume) rows of the pre-sorted frames in ranked,
+    sizes of each, without duplicates and most promising first.
+    """
+    return _search_order(pd.concat([frame.head(n) for frame, n in zip(ranked, sizes)]).drop_duplicates(subset=['P']),
+                         win, max_n)
+
+
+def _depth2_cost(C, win, max_n, costs):
+    """Estimated seconds for the depth-2 scan over parts C: rows plus (partner, nA) cells built."""
+    n = len(C)
+    k = np.clip(np.ceil(win[1] / C) - 1, 0, max_n - 1)
+    cells = float(((n - 1 - np.arange(n)) * k).sum())
+    return costs['row'] * n + costs['cell2'] * cells
+
+
+def _depth3_cost(C, V, E, win, max_n, costs, samples=4000):
+    """
+    Estimated seconds for the depth-3 scan over parts C. The left-half cells are counted
+    exactly; the complement matches per cell are the mean over random (i, j, nA, nB) cells,
+    looked up in the single-multiple table the way _depth3_block does (seeded, so repeatable).
+    """
+    m = len(C)
+    if m < 3 or max_n < 3: return costs['row'] * m
+    counts = max_n - 2
+    raw = float((m - 1 - np.arange(m)).sum()) * counts ** 2
+    singles = _single_multiples(C, V, E, win[1], counts)['c']
+    rng = np.random.default_rng(0)
+    a, b = rng.integers(0, m, samples), rng.integers(0, m, samples)
+    i, j = np.minimum(a, b), np.maximum(a, b)
+    nA, nB = rng.integers(1, counts + 1, samples), rng.integers(1, counts + 1, samples)
+    s = nA*C[i] + nB*C[j]
+    ok = (i < j) & (nA + nB <= max_n - 1) & (s < win[1])
+    hits = np.searchsorted(singles, win[1] - s, side='right') - np.searchsorted(singles, win[0] - s, side='left')
+    per_cell = float(np.where(ok, hits, 0).mean())
+    return costs['row'] * m + costs['left3'] * raw + costs['hit3'] * raw * per_cell
+
+
+def _ragged_arange(starts, lengths):
+    """(row, value) pairs for the ranges starts[r] .. starts[r] + lengths[r] - 1, concatenated."""
+    lengths = np.maximum(lengths, 0)
+    row = np.repeat(np.arange(len(starts)), lengths)
+    return row, starts[row] + (np.arange(int(lengths.sum())) - (np.cumsum(lengths) - lengths)[row])
+
+
+def _deep_block(ing, i, win, max_n, max_sys_esr, min_types, max_types, vol_cap=np.inf, chunk=1 << 20):
+    """
+    Branch-and-bound over stacks of min_types..max_types distinct parts whose first part is i.
+
+    Ingredients must be sorted by volumetric density ing['D'] (descending) and parts are only
+    added in index order, so every part still to be added is at most as dense as the next
+    candidate. Covering the remaining capacitance therefore costs at least remaining / D[next]
+    of volume, and each type still owed costs at least the smallest remaining volume; any
+    branch whose volume plus that bound reaches vol_cap is cut. Suffix minima of C cut
+    branches that can no longer fit the owed types under the window.
+
+    The tree is walked one level at a time: all live partial stacks with t types are expanded
+    together as arrays (in chunks of about `chunk` pairs), and every level from min_types - 1
+    on also places its last part in the same batched way.
+
+    Returns (parts, counts, total cap, system ESR, volume); parts/counts are m x max_types,
+    padded with -1 / 0.
+    """
+    C, V, E, D = ing['C'], ing['V'], ing['E'], ing['D']
+    m = len(C)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        G = np.where(E > 0, 1.0 / E, 999999)
+    # Suffix minima with a sentinel so index m means "nothing left"
+    min_c = np.append(np.minimum.accumulate(C[::-1])[::-1], np.inf)
+    min_v = np.append(np.minimum.accumulate(V[::-1])[::-1], np.inf)
+    dens = np.append(D, 0.0)
+
+    def need_vol(rem_c, owed, s):
+        """Admissible volume still required from candidates s.. (arrays)."""
+        with np.errstate(divide='ignore', invalid='ignore'):
+            by_cap = np.where(rem_c > 0, rem_c / dens[s], 0.0)
+        by_cap[(rem_c > 0) & (dens[s] <= 0)] = np.inf
+        return np.maximum(by_cap, owed * min_v[s])
+
+    def blocks(parts):
+        """Split live states into runs whose candidate spans stay near the chunk size."""
+        span = np.cumsum(m - 1 - parts[:, -1])
+        edges = np.searchsorted(span, np.arange(chunk, span[-1] if len(span) else 0, chunk))
+        return zip(np.r_[0, edges], np.r_[edges, len(parts)])
+
+    def pair_up(st, owed):
+        """(state, k) pairs for candidates after each state's last part that can still pay off."""
+        parts, c, v = st[0], st[2], st[3]
+        r, k = _ragged_arange(parts[:, -1] + 1, m - 1 - parts[:, -1])
+        room = c[r] + C[k] + (owed * min_c[k + 1] if owed else 0.0)
+        ok = (room <= win[1]) & \
+             (v[r] + need_vol(win[0] - c[r], owed + 1, k) < vol_cap)
+        return r[ok], k[ok]
+
+    def expand(st, owed):
+        """Children of every state in st; each must leave room for `owed` more types."""
+        parts, counts, c, v, g, n = st
+        r, k = pair_up(st, owed)
+        ub = np.minimum(max_n - n[r] - owed, np.floor((win[1] - c[r] - owed * min_c[k + 1]) / C[k]))
+        q, nk = _ragged_arange(np.ones(len(r), dtype=np.int64), ub.astype(np.int64))
+        r, k = r[q], k[q]
+        ck, vk = c[r] + nk*C[k], v[r] + nk*V[k]
+        ok = vk + need_vol(win[0] - ck, owed, k + 1) < vol_cap
+        r, k, nk = r[ok], k[ok], nk[ok]
+        return (np.column_stack([parts[r], k]), np.column_stack([counts[r], nk]),
+                ck[ok], vk[ok], g[r] + nk*G[k], n[r] + nk)
+
+    def close(st):
+        """Every way to finish each state with one more part inside the window."""
+        parts, counts, c, v, g, n = st
+        r, k = pair_up(st, 0)
+        lo = np.maximum(1, np.ceil((win[0] - c[r]) / C[k])).astype(np.int64)
+        hi = np.minimum(np.floor((win[1] - c[r]) / C[k]), max_n - n[r]).astype(np.int64)
+        ok = (hi >= lo) & (v[r] + lo*V[k] < vol_cap)
+        r, k, lo, hi = r[ok], k[ok], lo[ok], hi[ok]
+        q, nk = _ragged_arange(lo, hi - lo + 1)
+        r, k = r[q], k[q]
+        tot = c[r] + nk*C[k]
+        vol = v[r] + nk*V[k]
+        sys_esr = 1.0 / (g[r] + nk*G[k])
+        ok = (win[0] <= tot) & (tot <= win[1]) & (vol < vol_cap) & (sys_esr <= max_sys_esr)
+        r, k, nk = r[ok], k[ok], nk[ok]
+        pad = max_types - parts.shape[1] - 1
+        out.append((np.column_stack([parts[r], k, np.full((len(r), pad), -1)]),
+                    np.column_stack([counts[r], nk, np.zeros((len(r), pad), dtype=np.int64)]),
+                    tot[ok], sys_esr[ok], vol[ok]))
+
+    out = []
+    owed = max(min_types - 1, 1)
+    ni = np.arange(1, max_n - owed + 1)
+    ci, vi = ni * C[i], ni * V[i]
+    ok = (ci + owed * min_c[i + 1] <= win[1]) & (vi + need_vol(win[0] - ci, owed, np.full(len(ni), i + 1)) < vol_cap)
+    ni = ni[ok]
+    st = (np.full((len(ni), 1), i), ni[:, None], ci[ok], vi[ok], ni * G[i], ni)
+
+    for types in range(1, max_types):
+        if len(st[0]) == 0: break
+        nxt = []
+        for a, b in blocks(st[0]):
+            sub = tuple(x[a:b] for x in st)
+            if types + 1 >= min_types: close(sub)
+            if types + 1 < max_types: nxt.append(expand(sub, max(min_types - types - 1, 1)))
+        if not nxt: break
+        st = tuple(np.concatenate(cols) for cols in zip(*nxt))
+
+    if not out:
+        return (np.empty((0, max_types), dtype=np.int64), np.empty((0, max_types), dtype=np.int64),
+                np.empty(0), np.empty(0), np.empty(0))
+    return tuple(np.concatenate(cols) for cols in zip(*out))
+
+
+def _knapsack_min(units, weight, lo_u, hi_u, max_n, max_types, limit=50, stop=None):
+    """
+    Exact minimum-weight stacks on an integer capacitance grid (grouped bounded knapsack).
+
+    dp[t, n, c] is the least total weight of a stack with t distinct items, n pieces and
+    c capacitance units. Each item is one group: it is either skipped or used once with a
+    count of 1..max_n, so pool depth and max_count are enforced exactly. For every item
+    only the cells it improved are kept (as sorted flat indices and counts), which is all
+    the walk back from a final cell needs.
+
+    Returns (bound, stacks, done): the least weight over every t >= 1, n >= 1 and c in
+    [lo_u, hi_u], up to `limit` of the cheapest final cells as (weight, [(item, count)]),
+    cheapest first, and whether every item was processed. stop() is polled before each item;
+    once it returns True the DP ends, the stacks use only the items seen so far and the
+    bound falls back to the trivial 0.
+    """
+    T, N, Hc = max_types + 1, max_n + 1, hi_u + 1
+    dp = np.full((T, N, Hc), np.inf)
+    dp[0, 0, 0] = 0.0
+    trace = []
+    done = True
+    for u, w in zip(units.tolist(), weight.tolist()):
+        if stop is not None and stop():
+            done = False
+            break
+        old = dp[:-1].copy()
+        choice = np.zeros(dp.shape, dtype=np.min_scalar_type(max_n))
+        for k in range(1, N):
+            if k * u >= Hc: break
+            cand = old[:, :N - k, :Hc - k*u] + k * w
+            dst = dp[1:, k:, k*u:]
+            better = cand < dst
+            dst[better] = cand[better]
+            choice[1:, k:, k*u:][better] = k
+        idx = np.flatnonzero(choice)
+        trace.append((idx, choice.ravel()[idx]))
+
+    final = dp[1:, 1:, lo_u:hi_u + 1]
+    flat = final.ravel()
+    order = np.argsort(flat, kind='stable')[:limit]
+    order = order[np.isfinite(flat[order])]
+    if len(order) == 0: return (np.inf if done else 0.0), [], done
+
+    stacks = []
+    for pos in order.tolist():
+        t, n, c = np.unravel_index(pos, final.shape)
+        t, n, c = int(t) + 1, int(n) + 1, int(c) + lo_u
+        picked = []
+        for item in range(len(trace) - 1, -1, -1):
+            if t == 0: break
+            idx, ks = trace[item]
+            at = np.searchsorted(idx, (t * N + n) * Hc + c)
+            if at < len(idx) and idx[at] == (t * N + n) * Hc + c:
+                k = int(ks[at])
+                picked.append((item, k))
+                t, n, c = t - 1, n - k, c - k * int(units[item])
+        stacks.append((float(flat[pos]), picked[::-1]))
+    return (float(flat[order[0]]) if done else 0.0), stacks, done
+
+
+def _knapsack_cost(units, hi_u, max_n, max_types, costs):
+    """Estimated seconds for _knapsack_min over items of the given units: DP cells updated times costs['dp']."""
+    T, N, Hc = max_types + 1, max_n + 1, hi_u + 1
+    k = np.arange(1, N)
+    span = np.clip(Hc - k * np.asarray(units, dtype=float)[:, None], 0, None)
+    cells = (max_types * (N - k) * span).sum() + len(units) * T * N * Hc
+    return costs['dp'] * float(cells)
+
+
+class LocalSearch:
+    """
+    Beam search with annealed selection over stacks of up to max_types part types.
+
+    Stacks are fixed-width rows of ingredient indices (-1 for an empty slot) and counts. Each
+    step() mutates every beam stack a few times (change a count, swap a part type, add or
+    drop a type), re-solves one random count so the capacitance lands back in the window when
+    it can, and keeps the best distinct stacks by the rank objective. Selection noise starts
+    at `temp` (log scale) and cools to zero, so early steps can leave a local optimum.
+    """
+    OBJECTIVES = {'Vol': 1, 'ESR': 4, 'Area': 2, 'Height': 3}
+
+    def __init__(self, ing, start, win, max_n, max_sys_esr, max_types, rng, rank_by='Vol',
+                 check=None, beam=32, moves=8, temp=0.1):
+        self.ing, self.win, self.max_n, self.max_sys_esr = ing, win, max_n, max_sys_esr
+        self.rng, self.col, self.check = rng, self.OBJECTIVES.get(rank_by, 1), check
+        self.beam, self.moves, self.temp = beam, moves, temp
+        P = np.full((len(start), max_types), -1, dtype=np.int64)
+        N = np.zeros((len(start), max_types), dtype=np.int64)
+        for r, (parts, counts) in enumerate(start):
+            P[r, :len(parts)], N[r, :len(counts)] = parts, counts
+        self.P, self.N = self._canonical(P, N)
+        self.seen = {row.tobytes() for row in np.hstack([self.P, self.N])}
+
+    @staticmethod
+    def _canonical(P, N):
+        """Slots sorted by ingredient, empty slots last, so equal stacks have equal rows."""
+        order = np.argsort(np.where(P >= 0, P, np.iinfo(np.int64).max), axis=1, kind='stable')
+        return np.take_along_axis(P, order, axis=1), np.take_along_axis(N, order, axis=1)
+
+    def _pick(self, mask):
+        """A random True column per row of mask, -1 where a row has none."""
+        r = np.where(mask, self.rng.random(mask.shape), -1.0)
+        col = r.argmax(axis=1)
+        col[~mask.any(axis=1)] = -1
+        return col
+
+    def evaluate(self, P, N):
+        """(total cap, vol, area, height, system ESR) per stack row."""
+        ing = self.ing
+        used = P >= 0
+        safe = np.where(used, P, 0)
+        n = np.where(used, N, 0)
+        E = ing['E'][safe]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            g = np.where(used, np.where(E > 0, n / E, 999999), 0.0).sum(axis=1)
+            esr = 1.0 / g
+        return ((n * ing['C'][safe]).sum(axis=1), (n * ing['V'][safe]).sum(axis=1),
+                (n * ing['A'][safe]).sum(axis=1), np.where(used, ing['H'][safe], 0.0).max(axis=1), esr)
+
+    def step(self, frac):
+        """
+        One round of moves at fraction frac of the run. Returns the feasible stacks not seen
+        before as (parts, counts, total cap, vol, area, height, system ESR) arrays.
+        """
+        rng, C, win = self.rng, self.ing['C'], self.win
+        P = np.repeat(self.P, self.moves, axis=0)
+        N = np.repeat(self.N, self.moves, axis=0)
+        rows = np.arange(len(P))
+        used = P >= 0
+        occ, free = self._pick(used), self._pick(~used)
+        move = rng.integers(0, 4, len(P))
+
+        m = move == 0   # change a count
+        N[rows[m], occ[m]] += rng.choice(np.array([-2, -1, 1, 2]), int(m.sum()))
+        m = move == 1   # swap a part type
+        P[rows[m], occ[m]] = rng.integers(0, len(C), int(m.sum()))
+        m = (move == 2) & (free >= 0)   # add a type
+        P[rows[m], free[m]] = rng.integers(0, len(C), int(m.sum()))
+        N[rows[m], free[m]] = 1
+        m = (move == 3) & (used.sum(axis=1) > 1)   # drop a type
+        N[rows[m], occ[m]] = 0
+        P = np.where(N > 0, P, -1)
+        N = np.where(P >= 0, N, 0)
+
+        # Re-solve one count for the window: the smallest that fits, or half the time any that does
+        fix = self._pick(P >= 0)
+        ok = fix >= 0
+        r, f = rows[ok], fix[ok]
+        c = C[P[r, f]]
+        rest = self.evaluate(P[r], N[r])[0] - N[r, f] * c
+        with np.errstate(divide='ignore', invalid='ignore'):
+            lo = np.maximum(1, np.ceil((win[0] - rest) / c))
+            hi = np.floor((win[1] - rest) / c)
+        fits = (lo <= hi) & (hi <= self.max_n)
+        spread = np.floor(rng.random(len(r)) * (hi - lo + 1)) * (rng.random(len(r)) < 0.5)
+        N[r[fits], f[fits]] = (lo + np.where(fits, spread, 0))[fits].astype(np.int64)
+
+        P, N = self._canonical(P, N)
+        tot, vol, area, height, esr = self.evaluate(P, N)
+        dup = ((P[:, 1:] == P[:, :-1]) & (P[:, 1:] >= 0)).any(axis=1)
+        ok = ((P >= 0).any(axis=1) & ~dup & (win[0] <= tot) & (tot <= win[1])
+              & (esr <= self.max_sys_esr) & (N.sum(axis=1) <= self.max_n))
+        if self.check is not None and ok.any():
+            ok[ok] = self.check(P[ok], N[ok])
+        keys = np.hstack([P, N])
+        _, first = np.unique(keys, axis=0, return_index=True)
+        unique = np.zeros(len(P), dtype=bool)
+        unique[first] = True
+        new = np.flatnonzero(ok & unique)
+        new = np.array([k for k in new.tolist() if keys[k].tobytes() not in self.seen], dtype=np.int64)
+        self.seen.update(keys[k].tobytes() for k in new.tolist())
+
+        # Next beam: best distinct stacks of the old beam and the new ones, with cooling noise
+        pool_P = np.vstack([self.P, P[new]])
+        pool_N = np.vstack([self.N, N[new]])
+        objs = np.column_stack(self.evaluate(pool_P, pool_N))
+        noise = np.exp(self.temp * (1.0 - frac) * rng.standard_normal(len(objs)))
+        keep = np.lexsort((objs[:, 1], objs[:, self.col] * noise))[:self.beam]
+        self.P, self.N = pool_P[keep], pool_N[keep]
+        return P[new], N[new], tot[new], vol[new], area[new], height[new], esr[new]
+
+
+def _dominated_parts(C, V, E, H, A, group, chunk=1 << 22):
+    """
+    Mask of parts another part in the same group beats outright at equal derated capacitance:
+    no more volume, ESR, height or footprint, and strictly less of one. Swapping such a part
+    for its sibling never changes a stack's capacitance and never makes an objective worse, so
+    no frontier stack needs it. (More capacitance is not "better": it can overshoot the window.)
+    Exact ties are left alone (neither dominates), so interchangeable parts all survive.
+    """
+    dominated = np.zeros(len(C), dtype=bool)
+    # Equal to 12 significant digits; derated values of one nominal/curve agree far closer
+    c_key = np.round(C / np.power(10.0, np.floor(np.log10(np.where(C > 0, C, 1.0)))), 11)
+    _, inv = np.unique(np.rec.fromarrays([group, c_key, np.floor(np.log10(np.where(C > 0, C, 1.0)))]),
+                       return_inverse=True)
+    inv = inv.ravel()
+    order = np.argsort(inv, kind='stable')
+    bounds = np.flatnonzero(np.diff(inv[order])) + 1
+    for idx in np.split(order, bounds):
+        if len(idx) < 2: continue
+        v, e, h, a = V[idx], E[idx], H[idx], A[idx]
+        step = max(1, chunk // len(idx))
+        for lo in range(0, len(idx), step):
+            p = slice(lo, lo + step)
+            # rows: candidate p (dominated?), columns: challenger q
+            no_worse = (v[None, :] <= v[p, None]) & (e[None, :] <= e[p, None]) & \
+                       (h[None, :] <= h[p, None]) & (a[None, :] <= a[p, None])
+            better = (v[None, :] < v[p, None]) | (e[None, :] < e[p, None]) | \
+                     (h[None, :] < h[p, None]) | (a[None, :] < a[p, None])
+            dominated[idx[p]] = (no_worse & better).any(axis=1)
+    return dominated
+
+
+class StackRecord:
+    """
+    Compact frontier entry: candidate-table rows and counts plus the objective values.
+
+    The search only ever stores these; the solution dict the app and caches read (BOM,
+    Cfg, Parts, Links) is built by present() for the stacks actually shown.
+    """
+    __slots__ = ('parts', 'counts', 'Vol', 'Cap', 'ESR', 'Area', 'Height')
+
+    def __init__(self, parts, counts, table, cap, esr):
+        self.parts = tuple(parts)
+        self.counts = tuple(counts)
+        picked = [(table[p], n) for p, n in zip(self.parts, self.counts)]
+        self.Vol = sum(n*r['V'] for r, n in picked)
+        self.Cap = cap
+        self.ESR = esr
+        self.Area = sum(n*r['A'] for r, n in picked)
+        self.Height = max(r['H'] for r, n in picked)
+
+    def count(self):
+        return sum(self.counts)
+
+    def sorted_parts(self, table):
+        """(row, count) pairs in display order: largest footprint first, then part name."""
+        return sorted(zip(self.parts, self.counts),
+                      key=lambda pc: (-float(table[pc[0]]['L'] * table[pc[0]]['W']), table[pc[0]]['P']))
+
+    def bom(self, table):
+        return " + ".join(f"{n}x {table[p]['K']}" for p, n in self.sorted_parts(table))
+
+    def present(self, table):
+        """Solution dict for this stack; table holds the candidate records by row."""
+        raw_parts = [
+            {'part': table[p]['P'], 'pkg': table[p]['K'], 'count': n,
+             'L': table[p]['L'], 'W': table[p]['W'], 'H': table[p]['H']}
+            for p, n in self.sorted_parts(table)
+        ]
+        lead = table[self.parts[0]]
+        if len(self.parts) == 1:
+            cfg_str = f"{self.counts[0]}x {lead['P']} ({lead['K']})"
+        else:
+            cfg_str = " + ".join(f"{p['count']}x {p['part']}" for p in raw_parts)
+        return {
+            'Vol': self.Vol, 'Cap': self.Cap, 'ESR': self.ESR, 'Area': self.Area, 'Height': self.Height,
+            'Type': f"{len(self.parts)}p",
+            'BOM': " + ".join(f"{p['count']}x {p['pkg']}" for p in raw_parts),
+            'Cfg': cfg_str,
+            'Parts': raw_parts,
+            'Links': lead['Url']
+        }
+
+
+class TopKTracker:
+    """
+    The best stacks by volume as last reported to a client, for "top-K changed" events.
+
+    Each stack that enters the reported slice gets a sequence key and is presented once;
+    update() returns only the stacks that entered, the keys that left and the new order.
+    """
+
+    def __init__(self, table, k):
+        self.table = table
+        self.k = k
+        self._keys = {}
+        self._order = []
+        self._next = 0
+
+    def update(self, recs):
+        """Delta event for the top k of recs, or None when the reported slice is unchanged."""
+        keys, added = {}, []
+        for rec in sorted(recs, key=lambda r: r.Vol)[:self.k]:
+            key = self._keys.get(rec)
+            if key is None:
+                key, self._next = self._next, self._next + 1
+                added.append({'key': key, 'stack': rec.present(self.table)})
+            keys[rec] = key
+        order = list(keys.values())
+        removed = [key for rec, key in self._keys.items() if rec not in keys]
+        if not added and not removed and order == self._order:
+            return None
+        self._keys, self._order = keys, order
+        return {'type': 'topk', 'added': added, 'removed': removed, 'order': order}
+
+
+def _stage_event(stage, state, prog):
+    return {'type': 'stage', 'stage': stage, 'state': state, 'progress': prog}
+
+
+def _progress_event(prog, status):
+    return {'type': 'progress', 'progress': prog, 'status': status}
+
+
+def _result_event(results, status, explored=1.0):
+    return {'type': 'result', 'progress': 100, 'results': results, 'status': status,
+            'partial': explored < 1.0, 'explored': explored}
+
+
+def _error_event(status):
+    return {'type': 'error', 'progress': 100, 'status': status}
+
+
+def _cancelled_event(prog):
+    return {'type': 'cancelled', 'progress': prog, 'status': f"Cancelled at {prog}% progress."}
+
+
+def _legacy_tuples(events):
+    """
+    Turn a solve event stream back into (progress, partial results, status) tuples.
+
+    Partial results are the current top stacks by volume, rebuilt from the topk deltas.
+    """
+    top, order = {}, []
+    for event in events:
+        kind = event['type']
+        if kind == 'topk':
+            for key in event['removed']:
+                del top[key]
+            for entry in event['added']:
+                top[entry['key']] = entry['stack']
+            order = event['order']
+        elif kind == 'progress':
+            yield (event['progress'], [top[k] for k in order], event['status'])
+        elif kind == 'result':
+            yield (100, event['results'], event['status'])
+        elif kind in ('error', 'cancelled'):
+            yield (100, [], event['status'])
+
+
+class ParetoArchive:
+    """
+    Non-dominated solution store over (Vol, ESR, Area, Height, part count).
+
+    Entries stay sorted by volume. A newcomer can only be dominated by entries with
+    volume <= its own and can only dominate entries with volume >= its own, so each
+    insert bisects on volume and checks one side of the split. Batches are screened
+    entry by entry in order of how many candidates each entry has rejected so far;
+    the few strong entries reject almost every hit, so the survivors left for the
+    rest of the frontier shrink to a handful after the first few entries.
+
+    Electrically identical stacks (equal objectives) do not dominate each other, so
+    alternatives survive for _rank_results(). When the frontier outgrows
+    max_size the largest-volume entries are dropped and nothing at or above the
+    dropped volume is admitted again, so entries strictly below that cutoff are always
+    exactly the frontier there.
+    """
+    OBJECTIVES = ('Vol', 'ESR', 'Area', 'Height', 'Count')
+
+    def __init__(self, max_size=1000):
+        self.max_size = max_size
+        self._obj = np.empty((0, len(self.OBJECTIVES)))
+        self._kills = np.empty(0, dtype=np.int64)
+        self._items = []
+        self._cutoff = np.inf
+
+    def __len__(self):
+        return len(self._items)
+
+    def items(self):
+        """Current frontier, ascending volume."""
+        return list(self._items)
+
+    def vol_bound(self):
+        """Volume a newcomer must beat to get in (inf until the archive first overflows)."""
+        if len(self._items) < self.max_size: return self._cutoff
+        return min(self._cutoff, self._obj[self.max_size - 1, 0])
+
+    def max_vol(self):
+        return self._obj[-1, 0] if len(self._items) else np.inf
+
+    def seed_state(self):
+        """Frontier rows, rejection counts and cutoff: enough to rebuild an equally strong screen."""
+        return self._obj.copy(), self._kills.copy(), self._cutoff
+
+    @classmethod
+    def seeded(cls, state, max_size):
+        """Archive holding another archive's frontier (from seed_state()) as placeholder None items."""
+        arc = cls(max_size)
+        arc._obj, arc._kills, arc._cutoff = state[0].copy(), state[1].copy(), state[2]
+        arc._items = [None] * len(arc._obj)
+        return arc
+
+    def snapshot(self):
+        """(objective rows, items) of the current frontier, for merging into another archive."""
+        return self._obj.copy(), list(self._items)
+
+    def kth_vol(self, k):
+        """Volume of the k-th smallest entry (inf while there are fewer than k)."""
+        return self._obj[k - 1, 0] if len(self._items) >= k else np.inf
+
+    def not_dominated(self, objs):
+        """Row mask of objs (m x 5) that no current entry dominates and that beat vol_bound()."""
+        objs = np.asarray(objs, dtype=float).reshape(-1, len(self.OBJECTIVES))
+        bound = self.vol_bound()
+        alive = np.nonzero(objs[:, 0] < bound)[0]
+        if len(alive) < len(objs): self._cutoff = min(self._cutoff, bound)
+        cols = [np.ascontiguousarray(objs[:, d]) for d in range(objs.shape[1])]
+        for r in np.argsort(-self._kills, kind='stable').tolist():
+            if len(alive) == 0: break
+            a = self._obj[r]
+            ge = cols[0][alive] >= a[0]
+            gt = cols[0][alive] > a[0]
+            for d in range(1, len(cols)):
+                col = cols[d][alive]
+                ge &= col >= a[d]
+                gt |= col > a[d]
+            dom = ge & gt
+            if dom.any():
+                self._kills[r] += int(dom.sum())
+                alive = alive[~dom]
+        keep = np.zeros(len(objs), dtype=bool)
+        keep[alive] = True
+        return keep
+
+    def insert(self, obj, item):
+        """Add item with objective vector obj unless dominated. Returns True if it was kept."""
+        obj = np.asarray(obj, dtype=float)
+        vols = self._obj[:, 0]
+        pos = int(np.searchsorted(vols, obj[0], side='right'))
+        if pos >= self.max_size or obj[0] >= self._cutoff:
+            self._cutoff = min(self._cutoff, obj[0])
+            return False
+
+        head = self._obj[:pos]
+        if len(head) and np.any(np.all(head <= obj, axis=1) & np.any(head < obj, axis=1)):
+            return False
+
+        lo = int(np.searchsorted(vols, obj[0], side='left'))
+        tail = self._obj[lo:]
+        beaten = np.all(obj <= tail, axis=1) & np.any(obj < tail, axis=1)
+        if beaten.any():
+            keep = np.concatenate([np.ones(lo, dtype=bool), ~beaten])
+            self._obj, self._kills = self._obj[keep], self._kills[keep]
+            self._items = [it for it, k in zip(self._items, keep) if k]
+            pos = int(np.searchsorted(self._obj[:, 0], obj[0], side='right'))
+
+        self._obj = np.insert(self._obj, pos, obj, axis=0)
+        self._kills = np.insert(self._kills, pos, 0)
+        self._items.insert(pos, item)
+        if len(self._items) > self.max_size:
+            self._cutoff = min(self._cutoff, self._obj[self.max_size, 0])
+            self._obj, self._kills = self._obj[:self.max_size], self._kills[:self.max_size]
+            del self._items[self.max_size:]
+        return True
+
+    def insert_batch(self, objs, build):
+        """Insert many candidates; build(k) makes the k-th item and only runs for those kept."""
+        objs = np.asarray(objs, dtype=float).reshape(-1, len(self.OBJECTIVES))
+        idx = np.nonzero(self.not_dominated(objs))[0]
+        added = 0
+        for k in idx[np.argsort(objs[idx, 0], kind='stable')].tolist():
+            if objs[k, 0] >= self.vol_bound(): break
+            head = self._obj[:int(np.searchsorted(self._obj[:, 0], objs[k, 0], side='right'))]
+            if len(head) and np.any(np.all(head <= objs[k], axis=1) & np.any(head < objs[k], axis=1)):
+                continue
+            added += self.insert(objs[k], build(k))
+        return added
+
+
+def _depth2_objectives(V, A, H, i, j, nA, nB, sys_esr):
+    """Archive objective rows for depth-2 hits of part i."""
+    return np.column_stack([
+        nA*V[i] + nB*V[j], sys_esr, nA*A[i] + nB*A[j], np.maximum(H[i], H[j]), nA + nB
+    ])
+
+
+def _depth3_objectives(ing, i, hits):
+    """Archive objective rows for depth-3 hits of part i (as returned by _depth3_block)."""
+    j, nA, nB, kk, nC, _, sys_esr, vol = hits
+    return np.column_stack([
+        vol, sys_esr, nA*ing['A'][i] + nB*ing['A'][j] + nC*ing['A'][kk],
+        np.maximum(ing['H'][i], np.maximum(ing['H'][j], ing['H'][kk])), nA + nB + nC
+    ])
+
+
+def _depth3_stacks(lab, i, hits):
+    """(part rows, counts) of depth-3 hits of part i, with parts mapped through lab."""
+    j, nA, nB, kk, nC = hits[:5]
+    return (np.column_stack([np.full(len(j), lab[i]), lab[j], lab[kk]]), np.column_stack([nA, nB, nC]))
+
+
+# Per-process search arrays for sharded solves, set once by the pool initializer
+_SHARD = {}
+
+
+def _past(deadline):
+    """Whether a time.time() deadline (None for no limit) has passed; wall time works across processes."""
+    return deadline is not None and time.time() >= deadline
+
+
+class CancelToken:
+    """Cooperative cancellation flag for one solve; the search checks it between outer-loop rows."""
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+
+def _init_shard_worker(payload):
+    _SHARD.clear()
+    _SHARD.update(payload)
+
+
+def _warm_rows(n, workers):
+    """Outer-loop rows to run in-process before sharding the rest (all of them when serial)."""
+    return n if workers <= 1 else min(n, max(workers, n // 8))
+
+
+def _shard_rows(rows, workers, per_worker=4):
+    """Interleave outer-loop rows into shards; early rows have the most partners, so stride them."""
+    rows = list(rows)
+    count = max(1, min(len(rows), workers * per_worker))
+    return [rows[t::count] for t in range(count)]
+
+
+def _run_shards(workers, payload, fn, shards):
+    """
+    Run fn(*shard) for every shard on a process pool whose workers receive payload once,
+    through the initializer. Results are yielded in shard order so merges are repeatable.
+    """
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_shard_worker, initargs=(payload,))
+    try:
+        futures = [pool.submit(fn, *shard) for shard in shards]
+        for fut in futures:
+            yield fut.result()
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def _shard_result(local):
+    objs, items = local.snapshot()
+    keep = [k for k, it in enumerate(items) if it is not None]
+    return objs[keep], [items[k] for k in keep]
+
+
+def _depth2_shard(rows):
+    """
+    Local depth-2 frontier for outer rows; items are (i, j, nA, nB, cap, esr).
+    Stops at the payload deadline and also returns how many rows it ran.
+    """
+    s = _SHARD
+    local = ParetoArchive.seeded(s['seed'], s['max_sols'])
+    done = 0
+    for i in rows:
+        if _past(s['deadline']): break
+        j, nA, nB, tot_c, sys_esr = _depth2_block(s['C'], s['E'], i, s['win'], s['max_n'], s['max_sys_esr'])
+        objs = _depth2_objectives(s['V'], s['A'], s['H'], i, j, nA, nB, sys_esr)
+        hits = (j, nA, nB, tot_c, sys_esr)
+        keep = _mask_keep(s['mask'], np.column_stack([np.full(len(j), s['lab'][i]), s['lab'][j]]),
+                          np.column_stack([nA, nB]))
+        _insert_masked(local, objs, lambda k: (i,) + tuple(h[k].item() for h in hits), keep)
+        done += 1
+    return _shard_result(local) + (done,)
+
+
+def _depth3_shard(rows, vol_cap):
+    """
+    Local depth-3 frontier for outer rows; items are (i, j, nA, nB, k, nC, cap, esr).
+    Stops at the payload deadline and also returns how many rows it ran.
+    """
+    s = _SHARD
+    local = ParetoArchive.seeded(s['seed'], s['max_sols'])
+    done = 0
+    for i in rows:
+        if _past(s['deadline']): break
+        cap = min(vol_cap, local.vol_bound(), np.nextafter(local.max_vol(), np.inf))
+        hits = _depth3_block(s['ing'], s['singles'], i, s['win'], s['max_n'], s['max_sys_esr'], cap)
+        objs = _depth3_objectives(s['ing'], i, hits)
+        keep = _mask_keep(s['mask'], *_depth3_stacks(s['lab'], i, hits))
+        _insert_masked(local, objs, lambda k: (i,) + tuple(h[k].item() for h in hits[:-1]), keep)
+        done += 1
+    return _shard_result(local) + (done,)
+
+
+class SolveCache:
+    """
+    Finished solve results keyed by a hash of (normalized constraints, library hash).
+
+    The memory tier is an LRU of max_entries serialized results; the optional disk tier keeps
+    one JSON file per key under cache_dir so results survive restarts. File names start with
+    the library hash, and retain() drops every entry from any other library, so reloading a
+    changed library invalidates everything it made stale. Entries are stored as JSON text and
+    decoded on every hit, so callers can mutate what they get back. The memory tier is locked,
+    so one cache can serve concurrent solves.
+    """
+
+    def __init__(self, max_entries=128, cache_dir=None, max_disk_entries=2000):
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+        self.max_disk_entries = max_disk_entries
+        self._mem = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(library_hash, payload):
+        blob = json.dumps(payload, sort_keys=True, default=str)
+        return f"{(library_hash or 'nolib')[:16]}-{hashlib.sha256(blob.encode()).hexdigest()[:32]}"
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + ".json")
+
+    def get(self, key):
+        with self._lock:
+            text = self._mem.get(key)
+            if text is not None:
+                self._mem.move_to_end(key)
+        if text is None and self.cache_dir and os.path.exists(self._path(key)):
+            try:
+                with open(self._path(key), 'r', encoding='utf-8') as f:
+                    text = f.read()
+                os.utime(self._path(key))
+                self._remember(key, text)
+            except OSError:
+                text = None
+        with self._lock:
+            if text is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(text)
+
+    def put(self, key, results):
+        text = json.dumps(results, default=lambda o: o.item() if hasattr(o, 'item') else str(o))
+        self._remember(key, text)
+        if not self.cache_dir: return
+        try:
+            # Write-then-rename, as for the library cache
+            tmp_path = f"{self._path(key)}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(text)
+            os.replace(tmp_path, self._path(key))
+            self._prune_disk()
+        except OSError as e:
+            print(f"Could not write solve cache entry {key}: {e}")
+
+    def _remember(self, key, text):
+        with self._lock:
+            self._mem[key] = text
+            self._mem.move_to_end(key)
+            while len(self._mem) > self.max_entries:
+                self._mem.popitem(last=False)
+
+    def _disk_entries(self):
+        if not self.cache_dir or not os.path.isdir(self.cache_dir): return []
+        return [f for f in os.listdir(self.cache_dir) if f.endswith(".json")]
+
+    def _prune_disk(self):
+        files = self._disk_entries()
+        if len(files) <= self.max_disk_entries: return
+        paths = sorted((os.path.join(self.cache_dir, f) for f in files), key=os.path.getmtime)
+        for path in paths[:len(paths) - self.max_disk_entries]:
+            try: os.remove(path)
+            except OSError: pass
+
+    def retain(self, library_hash):
+        """Forget every entry not computed against library_hash."""
+        prefix = f"{(library_hash or 'nolib')[:16]}-"
+        with self._lock:
+            for key in [k for k in self._mem if not k.startswith(prefix)]:
+                del self._mem[key]
+        for f in self._disk_entries():
+            if not f.startswith(prefix):
+                try: os.remove(os.path.join(self.cache_dir, f))
+                except OSError: pass
+
+    def clear(self):
+        with self._lock:
+            self._mem.clear()
+        for f in self._disk_entries():
+            try: os.remove(os.path.join(self.cache_dir, f))
+            except OSError: pass
+
+
+class RaggedCurves:
+    """
+    Per-part curves packed into flat float arrays plus offsets.
+
+    Part i owns x[offsets[i]:offsets[i+1]] and the matching y slice, so the whole
+    library's DC-bias or ESR curves live in three typed arrays instead of strings.
+    """
+    __slots__ = ('x', 'y', 'offsets')
+
+    def __init__(self, x, y, offsets):
+        self.x = x
+        self.y = y
+        self.offsets = offsets
+
+    @classmethod
+    def from_columns(cls, x_cells, y_cells):
+        """Decode paired text columns. Missing or length-mismatched pairs get an empty segment."""
+        xs, ys = [], []
+        lengths = np.zeros(len(x_cells), dtype=np.int64)
+        for i, (xc, yc) in enumerate(zip(x_cells, y_cells)):
+            x = _parse_vector(xc)
+            y = _parse_vector(yc)
+            if len(x) == 0 or len(x) != len(y): continue
+            xs.append(x)
+            ys.append(y)
+            lengths[i] = len(x)
+        offsets = np.zeros(len(x_cells) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        x = np.concatenate(xs) if xs else np.empty(0)
+        y = np.concatenate(ys) if ys else np.empty(0)
+        return cls(x, y, offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def segment(self, i):
+        a, b = self.offsets[i], self.offsets[i + 1]
+        return self.x[a:b], self.y[a:b]
+
+    def take(self, rows):
+        """Sub-store holding the curves of the given part positions, in that order."""
+        rows = np.asarray(rows, dtype=np.int64)
+        starts = self.offsets[rows]
+        lengths = self.offsets[rows + 1] - starts
+        offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        idx = np.repeat(starts - offsets[:-1], lengths) + np.arange(offsets[-1])
+        return RaggedCurves(self.x[idx], self.y[idx], offsets)
+
+    @property
+    def nbytes(self):
+        return self.x.nbytes + self.y.nbytes + self.offsets.nbytes
+
+
+class LibraryIndex:
+    """
+    Columnar pre-filter index over the prepared library, built once per load.
+
+    Rows are laid out in ascending Capacitance order (unknown values last), so the loose
+    capacitance window is one searchsorted range. Each package, and each distinct rated
+    voltage / max temperature, has a packed bitmap over that order; a rating bitmap holds
+    every row rated at least that high. A query ORs the allowed package bitmaps, ANDs the
+    two rating bitmaps over the bytes spanning the range, and maps the surviving positions
+    back to library row numbers. Nothing scales with the rows outside the capacitance range
+    except the per-package bytes in it. Rating columns with more than max_levels distinct
+    values get no cumulative bitmaps and are compared over the range instead.
+    """
+
+    def __init__(self, df, max_levels=64):
+        n = len(df)
+        self.n = n
+        cap = self._numeric(df, 'Capacitance')
+        self.has_cap = 'Capacitance' in df.columns
+        self.order = np.argsort(cap, kind='stable') if self.has_cap else np.arange(n)
+        self.cap_sorted = cap[self.order][:np.count_nonzero(~np.isnan(cap))]
+
+        pkg = df['Package'].astype(str).to_numpy()[self.order] if 'Package' in df.columns else np.full(n, '')
+        self.pkg_bits = {p: np.packbits(pkg == p) for p in np.unique(pkg)}
+        self.volt = self._rating(self._numeric(df, 'VoltageRatedDC')[self.order], max_levels)
+        self.temp = self._rating(self._numeric(df, 'MaxTemp_Val')[self.order], max_levels)
+        # SRF only narrows what the other keys already selected, so it stays in row order
+        self.srf_hz = self._numeric(df, 'SRF_MHz') * 1e6
+
+    @staticmethod
+    def _numeric(df, col):
+        if col not in df.columns:
+            return np.full(len(df), np.nan)
+        return pd.to_numeric(df[col], errors='coerce').to_numpy(dtype=float)
+
+    @staticmethod
+    def _rating(values, max_levels):
+        """(sorted distinct levels, cumulative bitmaps or None, values in capacitance order)."""
+        levels = np.unique(values[~np.isnan(values)])
+        if len(levels) > max_levels:
+            return levels, None, values
+        return levels, [np.packbits(values >= lv) for lv in levels], values
+
+    @staticmethod
+    def _at_least(rating, x, b0, b1):
+        """Packed bytes b0:b1 of the 'value >= x' bitmap."""
+        levels, bits, values = rating
+        if bits is None:
+            return np.packbits(values[b0 * 8:b1 * 8] >= x)
+        k = np.searchsorted(levels, x, side='left')
+        if k == len(levels):
+            return np.zeros(b1 - b0, dtype=np.uint8)
+        return bits[k][b0:b1]
+
+    def select(self, min_cap, max_cap, packages, min_rated_v, min_temp, min_srf_hz):
+        """Ascending library row numbers passing every pre-filter check."""
+        if self.has_cap:
+            lo = np.searchsorted(self.cap_sorted, min_cap, side='left')
+            hi = np.searchsorted(self.cap_sorted, max_cap, side='right')
+        else:
+            lo, hi = 0, self.n
+        if lo >= hi:
+            return np.empty(0, dtype=np.int64)
+        b0, b1 = lo // 8, (hi + 7) // 8
+
+        acc = np.zeros(b1 - b0, dtype=np.uint8)
+        for p in packages:
+            if p in self.pkg_bits:
+                acc |= self.pkg_bits[p][b0:b1]
+        acc &= self._at_least(self.volt, min_rated_v, b0, b1)
+        acc &= self._at_least(self.temp, min_temp, b0, b1)
+
+        pos = np.flatnonzero(np.unpackbits(acc)) + b0 * 8
+        pos = pos[(pos >= lo) & (pos < hi)]
+        rows = np.sort(self.order[pos])
+        return rows[self.srf_hz[rows] > min_srf_hz]
+
+
+def _derate_curves(curves, bias):
+    """Derated capacitance at bias for every part; same clamping as get_derated()."""
+    v, c, off = curves.x, curves.y, curves.offsets
+    res = np.zeros(len(curves))
+    has = off[1:] > off[:-1]
+    if not has.any(): return res
+
+    first, last = off[:-1][has], off[1:][has] - 1
+    if bias <= 0:
+        res[has] = c[first]
+        return res
+    v_max = np.maximum.reduceat(v, first)
+    interp = _interp_ragged(v, c, off, bias)[has]
+    res[has] = np.where(bias > v_max, c[last], interp)
+    return res
+
+
+def _derate_grid(curves, biases):
+    """
+    _derate_curves() at every bias of a grid in one pass: (len(biases), parts) array.
+
+    The store is tiled once per bias and interpolated with a per-segment query, so each
+    row equals the single-bias call bit for bit.
+    """
+    biases = np.asarray(biases, dtype=float)
+    v, c, off = curves.x, curves.y, curves.offsets
+    n, nb = len(curves), len(biases)
+    res = np.zeros((nb, n))
+    lengths = np.diff(off)
+    has = lengths > 0
+    if not has.any() or nb == 0: return res
+
+    first, last = off[:-1][has], off[1:][has] - 1
+    tiled = np.zeros(nb * n + 1, dtype=np.int64)
+    np.cumsum(np.tile(lengths, nb), out=tiled[1:])
+    q = np.repeat(biases, n)
+    interp = _interp_ragged(np.tile(v, nb), np.tile(c, nb), tiled, q).reshape(nb, n)[:, has]
+    v_max = np.maximum.reduceat(v, first)
+    b = biases[:, None]
+    res[:, has] = np.where(b <= 0, c[first], np.where(b > v_max, c[last], interp))
+    return res
+
+
+def _esr_curves(curves, freq_hz):
+    """ESR at freq_hz for every part; log-log interpolation, edge clamped like get_esr()."""
+    f, e, off = curves.x, curves.y, curves.offsets
+    res = np.zeros(len(curves))
+    has = off[1:] > off[:-1]
+    if not has.any(): return res
+
+    first, last = off[:-1][has], off[1:][has] - 1
+    # Curves with non-positive points cannot go through log space; interpolate them linearly
+    bad = np.zeros(len(f) + 1, dtype=np.int64)
+    np.cumsum(~((f > 0) & (e > 0)), out=bad[1:])
+    all_valid = (bad[off[1:]] - bad[off[:-1]])[has] == 0
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_res = _interp_ragged(np.log10(f), np.log10(e), off, np.log10(freq_hz))[has]
+        inner = np.where(all_valid, np.power(10, log_res), _interp_ragged(f, e, off, freq_hz)[has])
+    res[has] = np.where(freq_hz <= f[first], e[first],
+               np.where(freq_hz >= f[last], e[last], inner))
+    return res
+
+
+class ImpedanceMask:
+    """
+    PDN target: a |Z(f)| limit on a log-spaced frequency grid, plus per-part admittances.
+
+    Each candidate is a series R-L-C branch: its derated capacitance, its ESR curve at
+    every grid frequency and the ESL implied by its SRF. n parts in parallel add n times
+    the branch admittance, so once bind() has built the (parts, frequencies) admittance
+    matrix, a stack's impedance over the whole band is a gather and a sum of its rows.
+    """
+
+    def __init__(self, points, n_freq=64):
+        pts = np.array(sorted((float(f), float(z)) for f, z in points))
+        f, z = pts[:, 0], pts[:, 1]
+        self.freqs = np.geomspace(f[0], f[-1], n_freq) if f[-1] > f[0] else f[:1]
+        # Straight lines between mask corners on a log-log plot
+        self.limit = np.power(10, np.interp(np.log10(self.freqs), np.log10(f), np.log10(z)))
+        self.Y = None
+
+    def bind(self, C, R, L):
+        """Admittance matrix from derated C (n,), ESR at every grid point (n, F) and ESL (n,)."""
+        w = 2 * np.pi * self.freqs
+        with np.errstate(divide='ignore', invalid='ignore'):
+            Z = R + 1j * (w * L[:, None] - 1.0 / (w * C[:, None]))
+            self.Y = np.where(Z != 0, 1.0 / Z, np.inf)
+
+    def ok(self, parts, counts, chunk=1 << 22):
+        """Stacks (part rows padded with -1, counts) whose |Z| stays under the limit everywhere."""
+        m, k = parts.shape
+        out = np.empty(m, dtype=bool)
+        step = max(1, chunk // max(1, k * len(self.freqs)))
+        for lo in range(0, m, step):
+            p, c = parts[lo:lo + step], counts[lo:lo + step]
+            used = p >= 0
+            y = (np.where(used, c, 0)[:, :, None] * self.Y[np.where(used, p, 0)]).sum(axis=1)
+            # |Z| = 1/|Y| <= limit, without dividing
+            out[lo:lo + step] = (np.abs(y) * self.limit >= 1.0).all(axis=1)
+        return out
+
+
+def _mask_keep(mask, parts, counts):
+    """Indices of hits passing the impedance mask, or None when there is no mask."""
+    if mask is None:
+        return None
+    return np.flatnonzero(mask.ok(np.asarray(parts, dtype=np.int64), np.asarray(counts)))
+
+
+def _insert_masked(archive, objs, build, keep):
+    """archive.insert_batch() restricted to the hit indices in keep (all hits when None)."""
+    if keep is None:
+        archive.insert_batch(objs, build)
+    else:
+        archive.insert_batch(objs[keep], lambda k: build(keep[k].item()))
+
 
 class OptimizerService:
-    def __init__(self, library_path):
+    # Bracketed text columns decoded into RaggedCurves by load_library()
+    CURVE_COLUMNS = ['C_Cv__V', 'C_Cv__C', 'ESR__Freq', 'ESR__Ohm']
+    # Low-cardinality text columns kept as pandas categoricals
+    CATEGORY_COLUMNS = ['Package', 'TChar']
+    # Objectives the exact knapsack mode minimizes, mapped to candidate-table columns
+    EXACT_OBJECTIVES = {'Vol': 'V', 'Area': 'A'}
+    # Solution keys results may be ranked by (ties fall back to volume)
+    RANK_COLUMNS = ('Vol', 'Area', 'Height', 'ESR')
+    # Parameters applied to the finished frontier only; tightening them never needs a new search.
+    # max_n is not one: candidate sizing, search order and the capped frontier all depend on it.
+    POST_FILTER_PARAMS = ('max_sys_esr', 'rank_by', 'workers', 'exact', 'time_budget_ms')
+    # Frontier size kept during the search and number of ranked stacks returned
+    MAX_SOLS = 1000
+    RESULT_LIMIT = 50
+    # Per-session solve contexts kept for incremental re-filtering
+    MAX_SESSIONS = 32
+    # Exhaustive-search time the candidate budget aims for, and rough single-core costs (seconds
+    # per outer row, depth-2 cell, depth-3 left-half cell, depth-3 complement match and exact DP cell)
+    SEARCH_TARGET_S = 1.0
+    SEARCH_COSTS = {'row': 2e-5, 'cell2': 1.8e-7, 'left3': 5e-8, 'hit3': 8.7e-7, 'dp': 3.5e-9}
+    # Estimated seconds above which the exact stage skips an objective's DP
+    EXACT_LIMIT_S = 5.0
+    # (density, capacitance, smallest-volume) pick sizes the budget scales, and the scale range;
+    # local-search ingredients follow the scale of the deepest exhaustive depth that runs
+    SEARCH_PICKS = {'depth2': (500, 100, 50), 'depth3': (120, 60, 60), 'deep': (60, 30, 30), 'local': (120, 60, 60)}
+    BUDGET_SCALE = (0.1, 4.0)
+    # Candidate columns that make two parts interchangeable, and the alternates listed per result
+    EQUIVALENCE_COLUMNS = ['K', 'C', 'V', 'E', 'L', 'W', 'H']
+    MAX_ALTS = 100
+
+    def __init__(self, library_path, use_cache=True, result_cache_size=128, result_cache_dir=None):
         self.library_path = library_path
+        self.use_cache = use_cache
+        self.result_cache = SolveCache(result_cache_size, result_cache_dir)
+        self._sessions = OrderedDict()
+        self._sessions_lock = threading.Lock()
+        # In-flight solves by session, and what cancelling them saved
+        self._jobs = {}
+        self._jobs_lock = threading.Lock()
+        self._cancel_stats = {'cancelled_jobs': 0, 'cpu_saved_s': 0.0}
+        self.library_hash = None
         self.df_library = None
+        self.dc_curves = None
+        self.esr_curves = None
+        self.prefilter_index = None
+        self.part_esl = None
         self.package_areas = {
             "008004": 0.03125, "01005": 0.08, "0201": 0.18, "0204": 0.50,
             "0402": 0.50, "0306": 1.28, "0603": 1.28, "0508": 2.50,
@@ -26,30 +1359,25 @@ class OptimizerService:
                 print(f"Library file not found: {self.library_path}")
                 return
 
-            # Note: low_memory=False to avoid DtypeWarning
-            self.df_library = pd.read_csv(self.library_path, dtype={'Package': str}, low_memory=False)
-            
-            # Pre-calc MaxTemp
-            # Column mapping check (ensure these columns exist)
-            if 'MaxTemp' in self.df_library.columns:
-                self.df_library['MaxTemp_Val'] = self.df_library['MaxTemp'].apply(
-                    lambda x: float(re.sub(r'[^\d.]', '', str(x))) if pd.notna(x) else 85.0
-                )
-            else:
-                self.df_library['MaxTemp_Val'] = 85.0
-
-            # Normalize Package
-            self.df_library['Package'] = self.df_library['Package'].apply(
-                lambda x: str(x).strip()
-            )
+            if not (self.use_cache and self._load_cache()):
+                self._load_csv()
+                self.library_hash = self._source_hash()
+                if self.use_cache:
+                    self._write_cache()
 
-            # Ensure Dimensions are numeric
-            for col in ['Length_mm', 'Width_mm', 'MaxThickness_mm']:
-                if col in self.df_library.columns:
-                    self.df_library[col] = pd.to_numeric(self.df_library[col], errors='coerce').fillna(0.0)
+            # Results computed against any other library content are stale now
+            self.result_cache.retain(self.library_hash)
+            with self._sessions_lock:
+                self._sessions.clear()
 
             # Cache available packages
             if self.df_library is not None:
+                self.prefilter_index = LibraryIndex(self.df_library)
+                # ESL implied by the self-resonant frequency: 1 / ((2 pi SRF)^2 C_nominal); 0 if unknown
+                nominal = LibraryIndex._numeric(self.df_library, 'Capacitance')
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    esl = 1.0 / (np.square(2 * np.pi * self.prefilter_index.srf_hz) * nominal)
+                self.part_esl = np.where(np.isfinite(esl), esl, 0.0)
                 unique_pkgs = self.df_library['Package'].dropna().unique().tolist()
                 self.cached_packages = sorted(unique_pkgs, key=self.get_area_sort_key)
             else:
@@ -58,17 +1386,147 @@ class OptimizerService:
         except Exception as e:
             print(f"Error loading library: {e}")
 
+    def _load_csv(self):
+        # Note: low_memory=False to avoid DtypeWarning
+        self.df_library = pd.read_csv(self.library_path, dtype={'Package': str}, low_memory=False)
+        
+        # Pre-calc MaxTemp
+        # Column mapping check (ensure these columns exist)
+        if 'MaxTemp' in self.df_library.columns:
+            self.df_library['MaxTemp_Val'] = self.df_library['MaxTemp'].apply(
+                lambda x: float(re.sub(r'[^\d.]', '', str(x))) if pd.notna(x) else 85.0
+            )
+        else:
+            self.df_library['MaxTemp_Val'] = 85.0
+
+        # Normalize Package
+        self.df_library['Package'] = self.df_library['Package'].apply(
+            lambda x: str(x).strip()
+        )
+        for col in self.CATEGORY_COLUMNS:
+            if col in self.df_library.columns:
+                self.df_library[col] = self.df_library[col].astype('category')
+
+        # Ensure Dimensions are numeric
+        for col in ['Length_mm', 'Width_mm', 'MaxThickness_mm']:
+            if col in self.df_library.columns:
+                self.df_library[col] = pd.to_numeric(self.df_library[col], errors='coerce').fillna(0.0)
+
+        # Decode DC-bias / ESR curves once; every solve reads typed arrays from here on
+        self.df_library = self.df_library.reset_index(drop=True)
+        blank = [''] * len(self.df_library)
+        curve_cols = {}
+        for col in self.CURVE_COLUMNS:
+            curve_cols[col] = self.df_library[col].to_numpy() if col in self.df_library.columns else blank
+        self.dc_curves = RaggedCurves.from_columns(curve_cols['C_Cv__V'], curve_cols['C_Cv__C'])
+        self.esr_curves = RaggedCurves.from_columns(curve_cols['ESR__Freq'], curve_cols['ESR__Ohm'])
+        self.df_library = self.df_library.drop(columns=self.CURVE_COLUMNS, errors='ignore')
+
+    # --- Binary sidecar cache ---
+    # Murata_Unified_Library.csv -> Murata_Unified_Library.cache.npz, holding the fully
+    # prepared df_library (numeric columns as-is, text columns as codes + categories)
+    # and both curve stores. Valid while the source mtime/size match, or failing that,
+    # while its SHA-256 still matches (fresh checkouts and container copies touch mtime).
+
+    CACHE_VERSION = 1
+    # Bump when a search change alters results, so cached solves are not reused
+    RESULT_CACHE_VERSION = 4
+
+    def get_cache_path(self):
+        return os.path.splitext(self.library_path)[0] + ".cache.npz"
+
+    def _source_signature(self):
+        st = os.stat(self.library_path)
+        return {'mtime_ns': st.st_mtime_ns, 'size': st.st_size}
+
+    def _source_hash(self):
+        h = hashlib.sha256()
+        with open(self.library_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                h.update(chunk)
+        return h.hexdigest()
+
+    def _load_cache(self):
+        cache_path = self.get_cache_path()
+        if not os.path.exists(cache_path): return False
+        try:
+            with np.load(cache_path, allow_pickle=False) as z:
+                meta = json.loads(str(z['meta']))
+                if meta.get('version') != self.CACHE_VERSION: return False
+                sig = self._source_signature()
+                if (meta['mtime_ns'], meta['size']) != (sig['mtime_ns'], sig['size']):
+                    if meta['size'] != sig['size'] or meta['sha256'] != self._source_hash():
+                        return False
+
+                cols = {}
+                for name, kind in meta['columns']:
+                    if kind == 'num':
+                        cols[name] = z[f'col:{name}']
+                    else:
+                        cat = pd.Categorical.from_codes(z[f'codes:{name}'], z[f'cats:{name}'].astype(object))
+                        cols[name] = cat if name in self.CATEGORY_COLUMNS else np.asarray(cat, dtype=object)
+                df = pd.DataFrame(cols)
+                self.dc_curves = RaggedCurves(z['dc_x'], z['dc_y'], z['dc_off'])
+                self.esr_curves = RaggedCurves(z['esr_x'], z['esr_y'], z['esr_off'])
+            self.df_library = df
+            self.library_hash = meta['sha256']
+            return True
+        except Exception as e:
+            print(f"Ignoring unreadable library cache {cache_path}: {e}")
+            return False
+
+    def _write_cache(self):
+        cache_path = self.get_cache_path()
+        try:
+            meta = dict(self._source_signature(), version=self.CACHE_VERSION, sha256=self.library_hash, columns=[])
+            arrays = {}
+            for name in self.df_library.columns:
+                col = self.df_library[name]
+                if pd.api.types.is_numeric_dtype(col) and not isinstance(col.dtype, pd.CategoricalDtype):
+                    meta['columns'].append((name, 'num'))
+                    arrays[f'col:{name}'] = col.to_numpy()
+                else:
+                    if isinstance(col.dtype, pd.CategoricalDtype):
+                        codes, cats = col.cat.codes.to_numpy(), col.cat.categories
+                    else:
+                        codes, cats = pd.factorize(col, use_na_sentinel=True)
+                    meta['columns'].append((name, 'cat'))
+                    arrays[f'codes:{name}'] = codes.astype(np.int32)
+                    arrays[f'cats:{name}'] = np.array([str(c) for c in cats], dtype=str)
+            arrays.update(
+                dc_x=self.dc_curves.x, dc_y=self.dc_curves.y, dc_off=self.dc_curves.offsets,
+                esr_x=self.esr_curves.x, esr_y=self.esr_curves.y, esr_off=self.esr_curves.offsets,
+            )
+            arrays['meta'] = np.array(json.dumps(meta))
+
+            # Write-then-rename so a concurrent reader never sees a half-written file
+            tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                np.savez(f, **arrays)
+            os.replace(tmp_path, cache_path)
+        except Exception as e:
+            print(f"Could not write library cache {cache_path}: {e}")
+
     def get_available_packages(self):
         if self.df_library is None: return []
         return getattr(self, 'cached_packages', [])
 
+    def _row_curve(self, row, x_col, y_col, store):
+        """Curve arrays for one library row: parsed from text if present, else read from the store."""
+        if x_col in row:
+            x, y = _parse_vector(row.get(x_col, '')), _parse_vector(row.get(y_col, ''))
+            return x, y
+        if store is None or row.name is None: return np.empty(0), np.empty(0)
+        return store.segment(row.name)
+
+    def _batch_curves(self, df, x_col, y_col, store):
+        if x_col in df.columns:
+            return RaggedCurves.from_columns(df[x_col].to_numpy(), df[y_col].to_numpy())
+        return store.take(df.index.to_numpy())
+
     def get_esr(self, row, freq_hz):
         try:
-            f_str = str(row.get('ESR__Freq', '')).replace('[', '').replace(']', '').strip()
-            e_str = str(row.get('ESR__Ohm', '')).replace('[', '').replace(']', '').strip()
-            if not f_str or not e_str: return 0.0
-            f_vec = np.fromstring(f_str, sep=' ')
-            e_vec = np.fromstring(e_str, sep=' ')
+            f_vec, e_vec = self._row_curve(row, 'ESR__Freq', 'ESR__Ohm', self.esr_curves)
             if len(f_vec) == 0 or len(e_vec) == 0: return 0.0
             if freq_hz <= f_vec[0]: return e_vec[0]
             if freq_hz >= f_vec[-1]: return e_vec[-1]
@@ -84,11 +1542,7 @@ class OptimizerService:
 
     def get_derated(self, row, bias):
         try:
-            v_str = str(row.get('C_Cv__V', '')).replace('[', '').replace(']', '').strip()
-            c_str = str(row.get('C_Cv__C', '')).replace('[', '').replace(']', '').strip()
-            if not v_str or not c_str: return 0.0
-            v = np.fromstring(v_str, sep=' ')
-            c = np.fromstring(c_str, sep=' ')
+            v, c = self._row_curve(row, 'C_Cv__V', 'C_Cv__C', self.dc_curves)
             if len(v) == 0: return 0.0
             if bias <= 0: return c[0]
             if bias > v.max(): return c[-1]
@@ -96,360 +1550,1024 @@ class OptimizerService:
         except: 
             return 0.0
 
-    def solve_generator(self, constraints):
-        if self.df_library is None:
-            yield (100, [], "Error: Murata database is not loaded.")
-            return
+    def get_derated_batch(self, df, bias):
+        """Vectorized get_derated() over every row of df. Returns 0.0 where no curve exists."""
+        return _derate_curves(self._batch_curves(df, 'C_Cv__V', 'C_Cv__C', self.dc_curves), bias)
 
-        yield (2, [], f"Querying {len(self.df_library)} Murata caps from database...")
-        
-        # Unpack constraints
+    def get_esr_batch(self, df, freq_hz):
+        """Vectorized get_esr() over every row of df."""
+        return _esr_curves(self._batch_curves(df, 'ESR__Freq', 'ESR__Ohm', self.esr_curves), freq_hz)
+
+    def _unpack_constraints(self, constraints):
+        """Normalize a constraints dict into the parameters the search uses."""
         if 'min_cap' in constraints and 'max_cap' in constraints:
             min_c = float(constraints['min_cap'])
             max_c = float(constraints['max_cap'])
-            target_F = (min_c + max_c) / 2.0
         else:
             target_F = float(constraints.get('target_cap', 100)) * 1e-6
             tol = float(constraints.get('tolerance', 1.0)) / 100.0
             min_c = target_F * (1 - tol)
             max_c = target_F * (1 + tol)
 
-        win = (min_c, max_c)
         bias = float(constraints.get('dc_bias', 5.0))
-        max_n = int(constraints.get('max_count', 25))
-        
         overrate = float(constraints.get('overrate_pct', 0.0))
         if overrate > 0:
             min_rated_v = bias * (1.0 + overrate/100.0)
         else:
             min_rated_v = float(constraints.get('min_rated_volt', bias))
 
-        min_temp = float(constraints.get('min_temp', 85))
-        allowed_pkgs = set(constraints.get('packages', []))
-        conn_type = int(constraints.get('conn_type', 2))
-        target_freq = float(constraints.get('target_freq', 100000))
-        max_sys_esr = float(constraints.get('max_esr', 1.0))
+        return {
+            'win': (min_c, max_c),
+            'bias': bias,
+            'max_n': int(constraints.get('max_count', 25)),
+            'min_rated_v': min_rated_v,
+            'min_temp': float(constraints.get('min_temp', 85)),
+            'allowed_pkgs': set(constraints.get('packages', [])),
+            'conn_type': int(constraints.get('conn_type', 2)),
+            'target_freq': float(constraints.get('target_freq', 100000)),
+            'max_sys_esr': float(constraints.get('max_esr', 1.0)),
+            'workers': int(constraints.get('workers', 1)),
+            'rank_by': str(constraints.get('rank_by', 'Vol')),
+            'exact': bool(constraints.get('exact', False)),
+            # Local search: iterations of beam moves after the exhaustive stages (0 = off), and
+            # the most part types its stacks may mix (never more than conn_type)
+            'local_search': int(constraints.get('local_search', 0)),
+            'local_search_types': int(constraints.get('local_search_types', 6)),
+            # Time the candidate budget sizes the exhaustive depths for (None: SEARCH_TARGET_S)
+            'target_latency_ms': float(constraints['target_latency_ms']) if constraints.get('target_latency_ms') else None,
+            # Wall-clock limit for the search; 0 runs it to completion
+            'time_budget_ms': float(constraints.get('time_budget_ms') or 0),
+            # PDN mode: [(freq_hz, max_ohm), ...] corners of a target impedance mask
+            'pdn_mask': tuple(sorted((float(f), float(z)) for f, z in constraints.get('pdn_mask') or ())),
+        }
 
-        # FILTER
-        yield (5, [], "Pruning library with loose Nominal Capacitance (±2 OOM), SRF, and Package filters...")
-        
-        # Ensure ESR and Derating columns exist to prevent total failure
-        required = ['VoltageRatedDC', 'MaxTemp_Val', 'Package', 'SRF_MHz']
-        for r in required:
+    def _missing_columns(self):
+        """First column the pre-filter needs that the library lacks, or None."""
+        for r in ['VoltageRatedDC', 'MaxTemp_Val', 'Package', 'SRF_MHz']:
             if r not in self.df_library.columns:
-                yield (100, [], f"Error: Optimization failed. Column '{r}' not found in library.")
+                return r
+        return None
+
+    def _prefilter(self, params):
+        """Library row numbers passing the rating, temperature, package, SRF and loose capacitance checks."""
+        min_c, max_c = params['win']
+        # Loose 100x margin (1% to 100000%) on nominal capacitance to allow for derating/parallel flexibility
+        return self.prefilter_index.select(min_c / 100.0, max_c * 1000.0, params['allowed_pkgs'],
+                                           params['min_rated_v'], params['min_temp'], params['target_freq'])
+
+    def _derate_rows(self, rows, params):
+        """Derated capacitance and ESR of library rows at the operating point."""
+        return (_derate_curves(self.dc_curves.take(rows), params['bias']),
+                _esr_curves(self.esr_curves.take(rows), params['target_freq']))
+
+    def _candidate_table(self, rows, params, derated=None):
+        """
+        Derate the candidate rows at the operating point and build the compact search table
+        (P, K, C, V, E, H, L, W, Url, A, D, R = library row). Parts that derate to nothing
+        are dropped. derated is a precomputed _derate_rows() result for rows, if one is at hand.
+        """
+        ce_all, esr_all = derated if derated is not None else self._derate_rows(rows, params)
+        keep = ce_all > 0
+        kept = self.df_library.iloc[rows[keep]]
+
+        names = kept['MfrPartName'].to_numpy()
+        vol = pd.to_numeric(kept['Volume_mm3'], errors='coerce').fillna(0.0).to_numpy(dtype=float)
+        length = kept['Length_mm'].to_numpy(dtype=float) if 'Length_mm' in kept.columns else np.zeros(len(kept))
+        width = kept['Width_mm'].to_numpy(dtype=float) if 'Width_mm' in kept.columns else np.zeros(len(kept))
+        ce = ce_all[keep]
+        df_proc = pd.DataFrame({
+            'P': names,
+            'K': kept['Package'].to_numpy(),
+            'C': ce,
+            'V': vol,
+            'E': esr_all[keep],
+            'H': kept['MaxThickness_mm'].to_numpy(dtype=float),
+            'L': length,
+            'W': width,
+            'Url': [f"https://www.digikey.com/en/products/result?keywords={p}" for p in names],
+            'A': length * width,
+        })
+        df_proc['D'] = np.divide(ce, vol, out=np.zeros_like(ce), where=vol > 0)
+        df_proc['R'] = rows[keep]
+        return df_proc
+
+    def _exact_stacks(self, df_proc, params, objective, resolution=200, max_units=20000, limit_s=np.inf, stop=None):
+        """
+        Provably minimal stack for one objective ('Vol' or 'Area') over every candidate.
+
+        Derated capacitance is put on a grid of (max_cap - min_cap) / resolution, capped at
+        max_units cells. Rounding moves a stack's total by at most half a cell per piece, so
+        the DP window is widened by max_count / 2 cells on each side. The DP is then a
+        relaxation, and its minimum is a lower bound on the true optimum (parts that share a
+        grid cell collapse to the lightest one, which only lowers the bound further). ESR
+        is left out of the DP. The cheapest DP stacks are re-checked against the exact window
+        and max_esr; if the cheapest one passes, it is the proven optimum. When the DP's
+        estimated run time exceeds limit_s it is not run and the report is marked skipped; when
+        stop() ends it early, the report is marked stopped and nothing is proven.
+        """
+        min_c, max_c = params['win']
+        max_n = params['max_n']
+        q = (max_c - min_c) / resolution
+        if q <= 0 or max_c / q + max_n / 2 > max_units:
+            q = max_c / (max_units - max_n / 2 - 1)
+        lo_u = max(int(np.ceil(min_c / q - max_n / 2)), 0)
+        hi_u = int(np.floor(max_c / q + max_n / 2))
+
+        C = df_proc['C'].to_numpy(dtype=float)
+        w = df_proc[self.EXACT_OBJECTIVES[objective]].to_numpy(dtype=float)
+        units = np.rint(C / q).astype(np.int64)
+        # One representative per grid cell: the lightest part
+        order = np.lexsort((w, units))
+        order = order[units[order] <= hi_u]
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = units[order][1:] != units[order][:-1]
+        rep = order[first]
+
+        est = _knapsack_cost(units[rep], hi_u, max_n, params['conn_type'], self.SEARCH_COSTS)
+        report = {'objective': objective, 'bound': np.inf, 'best': None, 'proven': False,
+                  'grid_F': q, 'items': len(rep), 'est_s': est, 'skipped': est > limit_s, 'stopped': False}
+        if report['skipped']:
+            return report
+        report['bound'], stacks, done = _knapsack_min(units[rep], w[rep], lo_u, hi_u, max_n, params['conn_type'], stop=stop)
+        report['stopped'] = not done
+        records = df_proc.to_dict('records')
+        for _, picked in stacks:
+            rows = [(records[rep[item]], k) for item, k in picked]
+            cap = sum(k * r['C'] for r, k in rows)
+            g = sum(k / r['E'] if r['E'] > 0 else 999999 for r, k in rows)
+            esr = 1.0 / g
+            if min_c <= cap <= max_c and esr <= params['max_sys_esr']:
+                report['record'] = StackRecord([rep[item] for item, _ in picked], [k for _, k in picked], records, cap, esr)
+                report['best'] = report['record'].present(records)
+                # bound <= true optimum <= this stack, so equality proves it
+                report['proven'] = done and report['best'][objective] <= report['bound'] + 1e-12 * max(report['bound'], 1.0)
+                break
+        return report
+
+    def solve_exact(self, constraints):
+        """
+        Exact min-volume and min-area stacks for a constraints dict, for checking the
+        heuristic search. Returns {objective: report} with the DP lower bound, the best
+        verified stack (or None) and whether that stack is proven optimal. Unlike the exact
+        stage of a solve, this runs the DP however long it takes.
+        """
+        if self.df_library is None or self._missing_columns():
+            return {}
+        params = self._unpack_constraints(constraints)
+        df_proc = self._candidate_table(self._prefilter(params), params)
+        if df_proc.empty:
+            return {}
+        return {obj: self._exact_stacks(df_proc, params, obj) for obj in self.EXACT_OBJECTIVES}
+
+    def result_key(self, constraints):
+        """Cache key for a constraints dict: equivalent inputs (e.g. target/tolerance vs min/max) share it."""
+        params = self._unpack_constraints(constraints)
+        params.pop('workers')
+        # A budgeted run that finishes is the full result; partial ones are never cached
+        params.pop('time_budget_ms')
+        params['allowed_pkgs'] = sorted(params['allowed_pkgs'])
+        return SolveCache.make_key(self.library_hash, {'v': self.RESULT_CACHE_VERSION, 'params': params})
+
+    def _exact_stage(self, df_proc, params, archive, mask=None, stop=None):
+        """
+        Insert the verified exact-knapsack stacks into archive and summarize how close they are
+        to proven. The DP knows nothing of an impedance mask; stacks breaking it are reported, not kept.
+        An objective whose DP is estimated to take over EXACT_LIMIT_S is skipped; the search results stand.
+        stop() is polled by the DP; once it returns True the best stacks found so far are kept unproven.
+        """
+        notes = []
+        for objective in self.EXACT_OBJECTIVES:
+            rep = self._exact_stacks(df_proc, params, objective, limit_s=self.EXACT_LIMIT_S, stop=stop)
+            best = rep['best']
+            if rep['skipped']:
+                notes.append(f"{objective} skipped (DP est. {rep['est_s']:.0f} s, over the {self.EXACT_LIMIT_S:g} s limit)")
+                continue
+            if not rep['items']:
+                notes.append(f"{objective}: no candidate fits the window")
+                continue
+            if best is not None and mask is not None and not self._record_passes(rep['record'], mask):
+                notes.append(f"{objective} {best[objective]:.4g} breaks the impedance mask")
+                continue
+            if best is not None:
+                rec = rep['record']
+                archive.insert((rec.Vol, rec.ESR, rec.Area, rec.Height, rec.count()), rec)
+            if rep['stopped']:
+                notes.append(f"{objective} {best[objective]:.4g} (DP stopped early, not proven)" if best is not None
+                             else f"{objective} DP stopped before verifying a stack")
+            elif rep['proven']:
+                notes.append(f"{objective} {best[objective]:.4g} (proven optimal)")
+            elif best is not None:
+                notes.append(f"{objective} {best[objective]:.4g} (lower bound {rep['bound']:.4g})")
+            else:
+                notes.append(f"{objective} lower bound {rep['bound']:.4g}, no exact stack verified")
+        return "Exact knapsack: " + "; ".join(notes)
+
+    def _collapse_equivalent(self, df_proc):
+        """
+        Keep one representative per set of electrically and physically identical candidates.
+        Returns the reduced table and {representative part: [other member parts]} for the
+        classes with more than one member.
+        """
+        cols = self.EQUIVALENCE_COLUMNS
+        first = ~df_proc.duplicated(subset=cols)
+        if first.all():
+            return df_proc, {}
+        gid = df_proc.groupby(cols, sort=False, dropna=False).ngroup().to_numpy()
+        names = df_proc['P'].to_numpy()
+        rep_of = dict(zip(gid[first.to_numpy()], names[first.to_numpy()]))
+        classes = {}
+        for g, name in zip(gid[~first.to_numpy()], names[~first.to_numpy()]):
+            classes.setdefault(rep_of[g], []).append(name)
+        return df_proc[first], classes
+
+    def _expand_alts(self, sol, classes):
+        """Add the member-swapped variants of a result's stacks to its Alts, up to MAX_ALTS."""
+        seen = {tuple((p['part'], p['count']) for p in sol['Parts'])}
+        seen.update(tuple((p['part'], p['count']) for p in alt) for alt in sol['Alts'])
+        for stack in [sol['Parts']] + list(sol['Alts']):
+            options = [[p] + [dict(p, part=name) for name in classes.get(p['part'], [])] for p in stack]
+            for combo in itertools.product(*options):
+                if len(sol['Alts']) >= self.MAX_ALTS:
+                    return
+                alt = sorted(combo, key=lambda x: (-float(x.get('L',0) * x.get('W',0)), x.get('part', '')))
+                key = tuple((p['part'], p['count']) for p in alt)
+                if key not in seen:
+                    seen.add(key)
+                    sol['Alts'].append(alt)
+
+    def _rank_results(self, recs, table, params, classes=None, mask=None):
+        """
+        Apply the post-search limits to a raw frontier, group electrically identical stacks
+        and present the top ones; only those become solution dicts. With classes from
+        _collapse_equivalent, each returned stack also lists the swaps of its representatives
+        for their interchangeable members in Alts. With a mask, only Alts that meet it are listed.
+        """
+        groups = {}
+        for rec in recs:
+            if rec.ESR > params['max_sys_esr'] or rec.count() > params['max_n']:
+                continue
+            # Relaxed tolerance to merge functionally identical parts (1uF vs 1.000001uF, 0.1 mOhm)
+            key = (round(rec.Cap, 6), round(rec.Vol, 5), round(rec.ESR, 4), round(rec.Height, 3), rec.bom(table))
+            groups.setdefault(key, []).append(rec)
+        if not groups:
+            return []
+
+        heads = [g[0] for g in groups.values()]
+        vols = np.array([rec.Vol for rec in heads])
+        rank_by = params['rank_by']
+        if rank_by == 'Vol':
+            order = np.argsort(vols, kind='quicksort')
+        else:
+            order = np.lexsort((vols, np.array([getattr(rec, rank_by) for rec in heads])))
+
+        members = list(groups.values())
+        results = []
+        for idx in order[:self.RESULT_LIMIT]:
+            primary, *alts = members[idx]
+            if mask is not None:
+                alts = [rec for rec in alts if self._record_passes(rec, mask)]
+            sol = primary.present(table)
+            sol['Alts'] = [rec.present(table)['Parts'] for rec in alts]
+            if classes:
+                self._expand_alts(sol, classes)
+            results.append(sol)
+        return results
+
+    def _remember_session(self, session_id, ctx):
+        with self._sessions_lock:
+            self._sessions[session_id] = ctx
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.MAX_SESSIONS:
+                self._sessions.popitem(last=False)
+
+    def _session(self, session_id):
+        """The stored solve context of session_id (now the most recently used), or None."""
+        if session_id is None:
+            return None
+        with self._sessions_lock:
+            ctx = self._sessions.get(session_id)
+            if ctx is not None:
+                self._sessions.move_to_end(session_id)
+            return ctx
+
+    def _can_refilter(self, ctx, params):
+        """True when params only tighten or re-rank what the stored search already covered."""
+        old = ctx['params']
+        same_search = all(old[k] == v for k, v in params.items() if k not in self.POST_FILTER_PARAMS)
+        return same_search and params['max_sys_esr'] <= old['max_sys_esr'] and (params['exact'] or not old['exact'])
+
+    def _refilter(self, ctx, params, token=None):
+        """Re-rank a stored frontier for new post-search limits without re-running the search."""
+        archive = ctx['archive']
+        if params['exact'] and not ctx['params']['exact']:
+            # Exact stacks join a copy of the frontier; the stored one stays as searched
+            yield _stage_event('exact', 'started', 50)
+            yield _progress_event(50, f"Solving exact knapsack DP over all {len(ctx['df_proc'])} stored candidates...")
+            stored = archive
+            archive = ParetoArchive(self.MAX_SOLS)
+            for rec in stored.items():
+                archive.insert((rec.Vol, rec.ESR, rec.Area, rec.Height, rec.count()), rec)
+            status = self._exact_stage(ctx['df_proc'], params, archive, ctx['mask'],
+                                       stop=lambda: token is not None and token.cancelled)
+            if token is not None and token.cancelled:
+                yield _stage_event('exact', 'finished', 50)
+                yield _cancelled_event(50)
                 return
+            yield _progress_event(90, status)
+            yield _stage_event('exact', 'finished', 90)
+        sols = archive.items()
+        yield _stage_event('rank', 'started', 95)
+        yield _progress_event(95, f"Re-filtering {len(sols)} stored stacks (search parameters unchanged)...")
+        results = self._rank_results(sols, ctx['table'], params, ctx['classes'], ctx['mask'])
+        yield _stage_event('rank', 'finished', 100)
+        yield _result_event(results, f"Re-ranked {len(results)} stacks from the previous search without re-running it.")
 
-        # Three-Stage Pre-Filtering (Fast)
-        mask = (self.df_library['VoltageRatedDC'] >= min_rated_v) & \
-               (self.df_library['MaxTemp_Val'] >= min_temp) & \
-               (self.df_library['Package'].isin(allowed_pkgs)) & \
-               ((self.df_library['SRF_MHz'] * 1e6) > target_freq)
-        
-        # Numeric Capacitance Check
-        # Since 'Capacitance' is clean and float (Farads), we can filter directly.
-        # We use a loose 100x margin (1% to 10000%) as requested to allow for derating/parallel flexibility
-        if 'Capacitance' in self.df_library.columns:
-            min_cutoff = min_c / 100.0
-            max_cutoff = max_c * 1000.0
-            mask = mask & (self.df_library['Capacitance'] >= min_cutoff) & \
-                          (self.df_library['Capacitance'] <= max_cutoff)
-        
-        candidates = self.df_library[mask].copy()
-        yield (10, [], f"Filtering caps based on C and V ({len(candidates)} remaining)...")
-        
-        yield (11, [], f"Calculating DC Bias derating & ESR for {len(candidates)} candidates...")
-        
-        processed = []
-        for _, r in candidates.iterrows():
-            ce = self.get_derated(r, bias)
-            esr_val = self.get_esr(r, target_freq)
-            if ce > 0:
-                p_data = {
-                    'P': r['MfrPartName'], 
-                    'K': r['Package'], 
-                    'C': ce, 
-                    'V': float(r['Volume_mm3']) if pd.notna(r['Volume_mm3']) else 0.0,
-                    'E': esr_val,
-                    'H': float(r['MaxThickness_mm']),
-                    'L': float(r.get('Length_mm', 0.0)),
-                    'W': float(r.get('Width_mm', 0.0)),
-                    'Url': f"https://www.digikey.com/en/products/result?keywords={r['MfrPartName']}"
-                }
-                p_data['A'] = p_data['L'] * p_data['W']
-                processed.append(p_data)
+    def solve_generator(self, constraints, session_id=None, legacy=False, token=None):
+        """
+        Stream progress events while solving constraints.
+
+        Events are dicts keyed by 'type':
+          'stage'      -- {'stage', 'state': 'started' | 'finished', 'progress'}
+          'candidates' -- {'stage', 'count'}: parts left after a filtering stage
+          'budget'     -- {'target_s', 'sizes', 'est_s'}: parts per exhaustive depth picked by the
+                          cost model, and the estimated seconds of each priced depth
+          'progress'   -- {'progress', 'status'}
+          'topk'       -- {'added': [{'key', 'stack'}], 'removed': [key], 'order': [key]}: the best
+                          RESULT_LIMIT stacks by volume changed; only stacks that entered are sent
+          'result'     -- {'progress', 'results', 'status', 'partial', 'explored'}: the ranked
+                          results, always last; partial when time_budget_ms stopped the search
+                          early, with explored the share of the search (0-1) that ran
+          'error'      -- {'progress', 'status'}: the solve failed, always last
+          'cancelled'  -- {'progress', 'status'}: the token was cancelled, always last
+        With legacy=True the old (progress, partial results, status) tuples are yielded instead.
+
+        With a session_id, the candidate table and raw frontier of the last full search are
+        kept for that session, and a follow-up query that only tightens max_esr or changes
+        rank_by is answered by re-filtering them instead of searching again; such answers are not
+        written to the result cache, which holds full searches only. The running
+        solve is also registered under it, so cancel(session_id) stops it at its next check.
+        A CancelToken may be passed in to cancel the solve directly.
+        """
+        token = CancelToken() if token is None else token
+        events = self._run_job(self._solve_events(constraints, session_id, token), session_id, token)
+        return _legacy_tuples(events) if legacy else events
+
+    def cancel(self, session_id):
+        """Cancel the session's in-flight solve, if any; True when one was running."""
+        with self._jobs_lock:
+            token = self._jobs.pop(session_id, None)
+        if token is None or token.cancelled:
+            return False
+        token.cancel()
+        return True
+
+    def cancel_stats(self):
+        """Running solves, solves cancelled so far and the CPU seconds their remaining work would have taken."""
+        with self._jobs_lock:
+            return dict(self._cancel_stats, running_jobs=len(self._jobs))
+
+    def _run_job(self, events, session_id, token):
+        """
+        Pass events through while the job is registered under session_id, counting its thread CPU.
+        A cancelled job's remaining CPU is estimated from its progress by linear extrapolation.
+        """
+        if session_id is not None:
+            with self._jobs_lock:
+                self._jobs[session_id] = token
+        spent, prog = 0.0, 0
+        try:
+            t0 = time.thread_time()
+            for event in events:
+                spent += time.thread_time() - t0
+                prog = event.get('progress', prog)
+                if event['type'] == 'cancelled':
+                    with self._jobs_lock:
+                        self._cancel_stats['cancelled_jobs'] += 1
+                        self._cancel_stats['cpu_saved_s'] += spent * (100 - prog) / max(prog, 1)
+                yield event
+                t0 = time.thread_time()
+        finally:
+            with self._jobs_lock:
+                if session_id is not None and self._jobs.get(session_id) is token:
+                    del self._jobs[session_id]
+
+    def _solve_events(self, constraints, session_id=None, token=None):
+        if self.df_library is None:
+            yield _error_event("Error: Murata database is not loaded.")
+            return
+
+        key = self.result_key(constraints)
+        cached = self.result_cache.get(key)
+        if cached is not None:
+            yield _result_event(cached, f"Loaded {len(cached)} cached results for these constraints.")
+            return
+
+        # A re-filtered frontier answers its own session only; the cache holds full searches
+        params = self._unpack_constraints(constraints)
+        ctx = self._session(session_id)
+        if ctx is not None and params['rank_by'] in self.RANK_COLUMNS and self._can_refilter(ctx, params):
+            yield from self._refilter(ctx, params, token)
+            return
+
+        for event in self._solve_uncached(constraints, session_id, token):
+            if event['type'] == 'result' and not event['partial']:
+                self.result_cache.put(key, event['results'])
+            yield event
+
+    def _solve_uncached(self, constraints, session_id=None, token=None):
+        params = self._unpack_constraints(constraints)
+        if params['rank_by'] not in self.RANK_COLUMNS:
+            yield _error_event(f"Error: Cannot rank results by '{params['rank_by']}'.")
+            return
+
+        deadline = time.time() + params['time_budget_ms'] / 1000.0 if params['time_budget_ms'] > 0 else None
+
+        yield _stage_event('prefilter', 'started', 2)
+        yield _progress_event(2, f"Querying {len(self.df_library)} Murata caps from database...")
+
+        # FILTER
+        yield _progress_event(5, "Pruning library with loose Nominal Capacitance (±2 OOM), SRF, and Package filters...")
         
-        if not processed:
-            yield (100, [], "Optimization complete: 0 results (no parts found within constraints).")
+        # Ensure ESR and Derating columns exist to prevent total failure
+        missing = self._missing_columns()
+        if missing:
+            yield _error_event(f"Error: Optimization failed. Column '{missing}' not found in library.")
+            return
+
+        candidates = self._prefilter(params)
+        yield {'type': 'candidates', 'stage': 'prefilter', 'count': len(candidates)}
+        yield _progress_event(10, f"Filtering caps based on C and V ({len(candidates)} remaining)...")
+        yield _stage_event('prefilter', 'finished', 10)
+
+        if token is not None and token.cancelled:
+            yield _cancelled_event(10)
+            return
+        yield _stage_event('derate', 'started', 11)
+        yield _progress_event(11, f"Calculating DC Bias derating & ESR for {len(candidates)} candidates...")
+        df_proc = self._candidate_table(candidates, params)
+        yield _stage_event('derate', 'finished', 11)
+        yield from self._search(df_proc, params, session_id, deadline=deadline, token=token)
+
+    @staticmethod
+    def _record_passes(rec, mask):
+        """Whether a StackRecord over the mask's candidate rows meets it."""
+        return bool(mask.ok(np.array([rec.parts]), np.array([rec.counts]))[0])
+
+    def _impedance_mask(self, df_proc, params):
+        """ImpedanceMask for params['pdn_mask'] bound to the rows of df_proc (by position)."""
+        mask = ImpedanceMask(params['pdn_mask'])
+        rows = df_proc['R'].to_numpy()
+        esr = self.esr_curves.take(rows)
+        R = np.column_stack([_esr_curves(esr, f) for f in mask.freqs])
+        mask.bind(df_proc['C'].to_numpy(dtype=float), R, self.part_esl[rows])
+        return mask
+
+    def _candidate_budget(self, df_proc, params):
+        """
+        Pick sizes for each depth, scaled so the estimated enumeration cost fits the target.
+
+        Depth 2 gets the whole target when it is the deepest exhaustive stage, a third with
+        depth 3 and a quarter with depth 4+, where depth 3 gets half and the branch-and-bound
+        stage (whose cost the model does not price) reuses the depth-3 scale, as do local-search
+        ingredients (the depth-2 scale below depth 3). Costs are single-core
+        so the sizes, and with them the results, do not depend on workers. Parts whose capacitance
+        alone overshoots the window can never be in a stack, so they are left out before sizing.
+        """
+        win, max_n, conn_type = params['win'], params['max_n'], params['conn_type']
+        target = params['target_latency_ms'] / 1000.0 if params['target_latency_ms'] else self.SEARCH_TARGET_S
+        useful = df_proc[df_proc['C'] <= win[1]]
+        ranked = (useful.sort_values(by='D', ascending=False), useful.sort_values(by='C', ascending=False),
+                  useful.sort_values(by='V', ascending=True))
+        costs = self.SEARCH_COSTS
+        shares = {1: (1.0, 0.0), 2: (1.0, 0.0), 3: (1 / 3, 2 / 3)}.get(conn_type, (0.25, 0.5))
+
+        def sized(base, scale):
+            return tuple(max(1, int(round(n * scale))) for n in base)
+
+        def cost2(scale):
+            picked = _pick_candidates(ranked, sized(self.SEARCH_PICKS['depth2'], scale), win, max_n)
+            return _depth2_cost(picked['C'].to_numpy(dtype=float), win, max_n, costs)
+
+        def cost3(scale):
+            picked = _pick_candidates(ranked, sized(self.SEARCH_PICKS['depth3'], scale), win, max_n)
+            return _depth3_cost(*(picked[k].to_numpy(dtype=float) for k in ('C', 'V', 'E')), win, max_n, costs)
+
+        def fit(cost, share):
+            """Largest scale in BUDGET_SCALE whose cost fits share (geometric bisection)."""
+            lo, hi = self.BUDGET_SCALE
+            if cost(hi) <= share: return hi
+            if cost(lo) > share: return lo
+            for _ in range(10):
+                mid = (lo * hi) ** 0.5
+                lo, hi = (mid, hi) if cost(mid) <= share else (lo, mid)
+            return lo
+
+        s2 = fit(cost2, target * shares[0])
+        budget = {'target_s': target, 'ranked': ranked, 'depth2': sized(self.SEARCH_PICKS['depth2'], s2),
+                  'est_s': {'depth2': cost2(s2)}}
+        budget['counts'] = {'depth2': len(_pick_candidates(ranked, budget['depth2'], win, max_n))}
+        if conn_type >= 3:
+            s3 = fit(cost3, target * shares[1])
+            budget['depth3'] = sized(self.SEARCH_PICKS['depth3'], s3)
+            budget['est_s']['depth3'] = cost3(s3)
+            budget['counts']['depth3'] = len(_pick_candidates(ranked, budget['depth3'], win, max_n))
+            if conn_type >= 4:
+                budget['deep'] = sized(self.SEARCH_PICKS['deep'], s3)
+                budget['counts']['deep'] = len(_pick_candidates(ranked, budget['deep'], win, max_n))
+        if params['local_search']:
+            budget['local'] = sized(self.SEARCH_PICKS['local'], s3 if conn_type >= 3 else s2)
+            budget['counts']['local'] = len(_pick_candidates(ranked, budget['local'], win, max_n))
+        return budget
+
+    def _search(self, df_proc, params, session_id=None, archive=None, track_top=True, deadline=None, token=None):
+        """
+        Search stages of a solve, from the derated candidate table to the ranked results, as events.
+        A caller-supplied archive may be pre-seeded with known stacks and is left holding the frontier;
+        callers that only want the result pass track_top=False to skip the topk events.
+
+        With a time.time() deadline the scans stop once it passes and the best stacks found so far
+        are ranked; the result event is then marked partial, with the explored share of the search.
+        A cancelled token stops them the same way, but ends with a cancelled event instead.
+        """
+        win, max_n = params['win'], params['max_n']
+        conn_type, max_sys_esr, workers = params['conn_type'], params['max_sys_esr'], params['workers']
+
+        if df_proc.empty:
+            yield _result_event([], "Optimization complete: 0 results (no parts found within constraints).")
             return
 
+        running = []
+        # Progress position where the deadline or a cancel stopped the search
+        cut = []
+
+        def out_of_time(pos):
+            """Whether to stop (deadline passed or cancelled); the first time, records how far the search got."""
+            if not cut and (_past(deadline) or (token is not None and token.cancelled)):
+                cut.append(pos)
+            return bool(cut)
+
+        def stage(name, prog):
+            """Finish the running stage, if any, and start the next one."""
+            if running:
+                yield _stage_event(running.pop(), 'finished', prog)
+            if name is not None:
+                running.append(name)
+                yield _stage_event(name, 'started', prog)
+
+        yield from stage('reduce', 12)
+
+        # Drop parts a same-package, same-capacitance sibling beats outright; the exact stage still sees them all
+        df_all = df_proc
+        # Table labels are df_all positions, so every search table can index the mask's rows directly
+        mask = None
+        if params['pdn_mask']:
+            mask = self._impedance_mask(df_all, params)
+            yield _progress_event(12, f"PDN mode: |Z| mask over {len(mask.freqs)} points from {mask.freqs[0]:.3g} to {mask.freqs[-1]:.3g} Hz...")
+        if mask is not None:
+            # Dominance and equivalence compare E at target_freq only; the mask also sees ESL and the whole ESR curve
+            classes = {}
+            yield _progress_event(12, f"PDN mode: keeping all {len(df_all)} candidates (no dominance or equivalence reduction)...")
+        else:
+            dominated = _dominated_parts(*(df_proc[k].to_numpy(dtype=float) for k in ('C', 'V', 'E', 'H', 'A')),
+                                         df_proc['K'].astype(str).to_numpy())
+            df_proc = df_proc[~dominated]
+            yield _progress_event(12, f"Removed {int(dominated.sum())} of {len(df_all)} candidates dominated by a same-footprint sibling...")
+            df_proc, classes = self._collapse_equivalent(df_proc)
+            n_members = sum(len(m) for m in classes.values())
+            if n_members:
+                yield _progress_event(12, f"Collapsed {n_members} interchangeable part numbers into {len(classes)} representatives...")
+
         # CALCULATE DENSITY
-        yield (12, [], f"Sorting {len(processed)} candidates based on Volumetric Density (C/V) and Derated Capacitance...")
-        for p in processed:
-            p['D'] = p['C'] / p['V'] if p['V'] > 0 else 0
-
-        df_proc = pd.DataFrame(processed)
-        top_dens = df_proc.sort_values(by='D', ascending=False).head(500)
-        top_cap = df_proc.sort_values(by='C', ascending=False).head(100)
-        # Also include smallest Volume parts (fillers)
-        top_vol_asc = df_proc.sort_values(by='V', ascending=True).head(50)
-        
-        combined = pd.concat([top_dens, top_cap, top_vol_asc]).drop_duplicates(subset=['P'])
+        yield {'type': 'candidates', 'stage': 'reduce', 'count': len(df_proc)}
+        yield _progress_event(12, f"Sorting {len(df_proc)} candidates based on Volumetric Density (C/V) and Derated Capacitance...")
+
+        budget = self._candidate_budget(df_proc, params)
+        est = budget['est_s']
+        yield {'type': 'budget', 'target_s': budget['target_s'], 'sizes': budget['counts'], 'est_s': est}
+        yield _progress_event(12, f"Candidate budget for a {budget['target_s']:g} s search: " + ", ".join(
+            f"{name} over {n} parts" + (f" (est. {est[name]:.2f} s)" if name in est else "")
+            for name, n in budget['counts'].items()) + "...")
+        ranked = budget['ranked']
+
+        # Densest parts, highest-capacitance parts and smallest Volume parts (fillers), sized by the budget
+        combined = _pick_candidates(ranked, budget['depth2'], win, max_n)
         search = combined.to_dict('records')
+        s_lab = combined.index.to_numpy()
         
-        yield (14, [], "Constructing search set of high-performance candidates...")
+        yield _progress_event(14, "Constructing search set of high-performance candidates...")
 
-        sols = []
-        MAX_SOLS = 1000
-        
-        def prune_solutions(s_list):
-            if len(s_list) > MAX_SOLS * 2:
-                s_list.sort(key=lambda x: x['Vol'])
-                return s_list[:MAX_SOLS]
-            return s_list
-
-        def deduplicate_solutions(s_list):
-            """Group electrically identical stacks."""
-            groups = {}
-            for sol in s_list:
-                # 1. Sort Parts deterministically to ensure canonical order
-                # Sort Keys:
-                # 1. Area Descending (Largest physical part first) -> -(L*W)
-                # 2. Package Name Descending (String sort, e.g. "0805" > "0402") -> Tie breaker for similar areas or 0 area
-                # 3. Part Name Ascending (Determine order for identical physical parts) -> Tie breaker
-                sol['Parts'].sort(key=lambda x: (
-                    -(x.get('L',0) * x.get('W',0)), 
-                    x.get('pkg', ''), 
-                    x.get('part', '')
-                ))
-                # Note: 'pkg' is descending (reversed) to put bigger numbers first? 
-                # '0805' > '0402' in string comparison. Yes. 
-                # But '1206' > '0805'? Yes.
-                # '01005' vs '0402'? '0' vs '0'. '1' vs '4'. '01005' < '0402'.
-                # So String Sort Ascending puts Small first.
-                # We want Big First. So we should Reverse string sort.
-                # Python sort is Low to High (Ascending).
-                # To get Descending, we can't negate a string.
-                # We can just change the key logic or rely on reverse argument? 
-                # We are using a tuple key. Can't mix reverse easily.
-                # Actually, we can use a custom wrapper or just rely on Area mostly.
-                # If Area is 0, 'pkg' sort matters.
-                # If I want Descending 'pkg' (0805 before 0402), I need a trick.
-                # But actually, 'pkg' isn't just numbers. 
-                # Let's simple use Area. If Area is Identical, then 'pkg' usually implies identical size.
-                # So just sorting by part name is enough for determinism.
-                # Previous failure was likely due to L/W being float weirdness or zero.
-                # Let's force strict float rules and just use Part Name as major tie breaker.
-                
-                sol['Parts'].sort(key=lambda x: (
-                    -float(x.get('L',0) * x.get('W',0)), 
-                    x.get('part', '')
-                ))
-                
-                # Re-generate BOM string from SORTED parts to ensure canonical "Key"
-                # This ensures "A+B" and "B+A" result in the same BOM string.
-                sol['BOM'] = " + ".join([f"{p['count']}x {p.get('pkg', '?')}" for p in sol['Parts']]) 
-                
-                # Key Generation
-                # Relaxed tolerance to merge functionally identical parts
-                key = (
-                    round(sol['Cap'], 6), # 1uF vs 1.000001uF should merge
-                    round(sol['Vol'], 5), 
-                    round(sol['ESR'], 4), # 0.1 mOhm difference is negligible
-                    round(sol['Height'], 3),
-                    sol['BOM'] 
-                )
-                
-                if key not in groups:
-                    # Initialize group with primary solution
-                    sol['Alts'] = [] 
-                    groups[key] = sol
-                else:
-                    # This is a duplicate (alternative parts). Add to the group.
-                    # Store the structured Parts list
-                    groups[key]['Alts'].append(sol['Parts'])
-                    
-            return list(groups.values())
+        # Frontier of non-dominated stacks; bounded so memory stays flat on loose queries
+        MAX_SOLS = self.MAX_SOLS
+        RESULT_LIMIT = self.RESULT_LIMIT
+        archive = ParetoArchive(MAX_SOLS) if archive is None else archive
+        # Candidate records by df_all position; frontier entries are StackRecords into this
+        table = df_all.to_dict('records')
+
+        top = TopKTracker(table, RESULT_LIMIT) if track_top else None
+
+        def progress(prog, status):
+            """Progress event, preceded by a topk event when the best stacks by volume changed."""
+            delta = top.update(archive.items()) if top is not None else None
+            if delta is not None:
+                yield delta
+            yield _progress_event(prog, status)
 
         # Pool Depth 1 Logic
-        yield (15, [], "Implementing Knapsack heuristics to find best candidates...")
-        for pA in search:
+        yield from stage('depth1', 15)
+        yield _progress_event(15, "Implementing Knapsack heuristics to find best candidates...")
+        for a, pA in enumerate(search):
+            if out_of_time(15 + 15 * (a / len(search))): break
             n_min = max(1, int(np.ceil(win[0]/pA['C'])))
             n_max = min(max_n, int(np.floor(win[1]/pA['C'])))
-            for n in range(n_min, n_max+1):
-                sys_esr = pA['E'] / n if n > 0 else pA['E']
-                if sys_esr <= max_sys_esr:
-                    sols.append({
-                        'Vol': n*pA['V'], 'Cap': n*pA['C'], 'ESR': sys_esr, 'Area': n*pA['A'], 'Height': pA['H'],
-                        'Type': '1p', 'BOM': f"{n}x {pA['K']}", 'Cfg': f"{n}x {pA['P']} ({pA['K']})",
-                        'Parts': [ {'part': pA['P'], 'pkg': pA['K'], 'count': n, 'L': pA['L'], 'W': pA['W'], 'H': pA['H']} ],
-                        'Links': pA['Url']
-                    })
-            sols = prune_solutions(sols)
+            n = np.arange(n_min, n_max + 1)
+            sys_esr = pA['E'] / n
+            n, sys_esr = n[sys_esr <= max_sys_esr], sys_esr[sys_esr <= max_sys_esr]
+            objs = np.column_stack([n*pA['V'], sys_esr, n*pA['A'], np.full(len(n), pA['H']), n])
+
+            def build(k, a=a, pA=pA, counts=n.tolist(), esrs=sys_esr.tolist()):
+                return StackRecord((s_lab[a],), (counts[k],), table, counts[k]*pA['C'], esrs[k])
+
+            _insert_masked(archive, objs, build, _mask_keep(mask, np.full((len(n), 1), s_lab[a]), n[:, None]))
         
-        if sols: yield (30, sols, "Parallel-1 configurations found. Expanding search...")
+        if len(archive): yield from progress(30, "Parallel-1 configurations found. Expanding search...")
+
+        def build2(i, j, nA, nB, tot_c, sys_esr):
+            return StackRecord((s_lab[i], s_lab[j]), (nA, nB), table, tot_c, sys_esr)
 
         # Pool Depth 2 Logic
-        if conn_type >= 2:
+        if conn_type >= 2 and not out_of_time(30):
             total_search = len(search)
-            yield (30, sols, "Executing Pool Depth 2 permutations search with Volume pruning...")
-            for i, pA in enumerate(search):
+            s_C = np.array([p['C'] for p in search], dtype=float)
+            s_E = np.array([p['E'] for p in search], dtype=float)
+            s_V = np.array([p['V'] for p in search], dtype=float)
+            s_A = np.array([p['A'] for p in search], dtype=float)
+            s_H = np.array([p['H'] for p in search], dtype=float)
+            yield from stage('depth2', 30)
+            yield from progress(30, "Executing Pool Depth 2 permutations search with Pareto pruning...")
+            # With workers, the densest rows run here first so every shard starts from a useful frontier
+            warm = _warm_rows(total_search, workers)
+            for i, pA in enumerate(search[:warm]):
+                if out_of_time(30 + 50 * (i / total_search)): break
                 prog = 30 + int(50 * (i / total_search))
                 if i % 10 == 0: 
-                    yield (prog, sols, "Scanning candidates for Pool Depth 2 configurations...")
-
-                for j, pB in enumerate(search):
-                    if j <= i: continue # Avoid permutations (A+B vs B+A) and self-pairs (A+A handled by 1p)
-                    
-                    for nA in range(1, max_n):
-                        rem_min = win[0] - nA*pA['C']
-                        rem_max = win[1] - nA*pA['C']
-                        if rem_min <= 0 and rem_max <= 0: break
-                        nB_min = max(1, int(np.ceil(max(0, rem_min) / pB['C'])))
-                        nB_max = int(np.floor(rem_max / pB['C']))
-                        for nB in range(nB_min, nB_max + 1):
-                            if nA + nB <= max_n:
-                                tot_c = nA*pA['C'] + nB*pB['C']
-                                if win[0] <= tot_c <= win[1]:
-                                    gA = (nA/pA['E']) if pA['E'] > 0 else 999999
-                                    gB = (nB/pB['E']) if pB['E'] > 0 else 999999
-                                    sys_esr = 1.0 / (gA + gB)
-                                    if sys_esr <= max_sys_esr:
-                                        # Construct Parts list
-                                        raw_parts = [
-                                            {'part': pA['P'], 'pkg': pA['K'], 'count': nA, 'L': pA['L'], 'W': pA['W'], 'H': pA['H']},
-                                            {'part': pB['P'], 'pkg': pB['K'], 'count': nB, 'L': pB['L'], 'W': pB['W'], 'H': pB['H']}
-                                        ]
-                                        # Sort immediately for canonical display (Area Desc, Name Asc)
-                                        raw_parts.sort(key=lambda x: (-(x.get('L',0) * x.get('W',0)), x.get('part', '')))
-                                        
-                                        # Generate BOM from sorted parts
-                                        bom_str = " + ".join([f"{p['count']}x {p.get('pkg', '?')}" for p in raw_parts])
-                                        cfg_str = " + ".join([f"{p['count']}x {p['part']}" for p in raw_parts])
-                                        
-                                        sols.append({
-                                            'Vol': nA*pA['V'] + nB*pB['V'], 'Cap': tot_c, 'ESR': sys_esr, 'Area': nA*pA['A'] + nB*pB['A'],
-                                            'Height': max(pA['H'], pB['H']), 'Type': '2p', 'BOM': bom_str,
-                                            'Cfg': cfg_str,
-                                            'Parts': raw_parts,
-                                            'Links': pA['Url']
-                                        })
-                sols = prune_solutions(sols)
+                    yield from progress(prog, "Scanning candidates for Pool Depth 2 configurations...")
+
+                # j > i avoids permutations (A+B vs B+A) and self-pairs (A+A handled by 1p)
+                j, nA, nB, tot_c, sys_esr = _depth2_block(s_C, s_E, i, win, max_n, max_sys_esr)
+                objs = _depth2_objectives(s_V, s_A, s_H, i, j, nA, nB, sys_esr)
+                hits = (j, nA, nB, tot_c, sys_esr)
+                keep = _mask_keep(mask, np.column_stack([np.full(len(j), s_lab[i]), s_lab[j]]), np.column_stack([nA, nB]))
+
+                # Records are only built for hits that make it onto the frontier
+                _insert_masked(archive, objs, lambda k, i=i, hits=hits: build2(i, *(h[k].item() for h in hits)), keep)
+
+            if warm < total_search and not cut:
+                payload = {'C': s_C, 'E': s_E, 'V': s_V, 'A': s_A, 'H': s_H, 'win': win, 'max_n': max_n,
+                           'max_sys_esr': max_sys_esr, 'max_sols': MAX_SOLS, 'seed': archive.seed_state(),
+                           'mask': mask, 'lab': s_lab, 'deadline': deadline}
+                shards = [(rows,) for rows in _shard_rows(range(warm, total_search), workers)]
+                done_frac = warm / total_search
+                ran = warm
+                for done, (objs, items, n_rows) in enumerate(_run_shards(workers, payload, _depth2_shard, shards)):
+                    archive.insert_batch(objs, lambda k, items=items: build2(*items[k]))
+                    ran += n_rows
+                    # Closing the shard generator cancels the shards still queued
+                    if token is not None and token.cancelled: break
+                    prog = 30 + int(50 * (done_frac + (1 - done_frac) * (done + 1) / len(shards)))
+                    yield from progress(prog, f"Merged {done + 1}/{len(shards)} Pool Depth 2 shards from {workers} workers...")
+                if ran < total_search:
+                    cut.append(30 + 50 * (ran / total_search))
 
         # Pool Depth 3 Logic
-        if conn_type >= 3:
-            # Fix: Expand search space for 3-pool permutations. Top 15 was too restrictive.
-            # Using Top 40 candidates drawn from diverse categories to ensuring "ingredients" for a good stack.
+        # Triples need at least one piece of each part, as _depth3_block assumes
+        if conn_type >= 3 and max_n >= 3 and not out_of_time(80):
+            # Meet-in-the-middle keeps the inner search logarithmic, so the ingredient set can be
+            # a few hundred parts drawn from diverse categories instead of the old top 40.
             
             # Construct distinct subsets of 'ingredients'
-            sub_d = df_proc.sort_values(by='D', ascending=False).head(20) # Top 20 High Density (Base parts)
-            sub_c = df_proc.sort_values(by='C', ascending=False).head(10) # Top 10 High Cap (Efficient Base)
-            sub_v = df_proc.sort_values(by='V', ascending=True).head(10)  # Top 10 Smallest Volume (Filler/Trimmer)
-            
-            subset_df = pd.concat([sub_d, sub_c, sub_v]).drop_duplicates(subset=['P'])
+            # High Density (Base parts), High Cap (Efficient Base), Smallest Volume (Filler/Trimmer)
+            subset_df = _pick_candidates(ranked, budget['depth3'], win, max_n)
             subset = subset_df.to_dict('records')
+            lab3 = subset_df.index.to_numpy()
+            ing = {k: subset_df[k].to_numpy(dtype=float) for k in ('C', 'V', 'E', 'A', 'H')}
+            singles = _single_multiples(ing['C'], ing['V'], ing['E'], win[1], max_n - 2)
+
+            def build3(i, j, nA, nB, kk, nC, tot, sys_esr):
+                return StackRecord((lab3[i], lab3[j], lab3[kk]), (nA, nB, nC), table, tot, sys_esr)
             
-            yield (80, sols, f"Deep searching Pool Depth 3 combinations ({len(subset)} diverse candidates)...")
+            yield from stage('depth3', 80)
+            yield from progress(80, f"Deep searching Pool Depth 3 combinations ({len(subset)} diverse candidates, {len(singles['c'])} single-part multiples)...")
             
             subset_len = len(subset)
-            for i, pA in enumerate(subset):
-                prog = 80 + int(15 * (i / subset_len))
-                yield (prog, sols, f"Scanning permutations {i+1}/{subset_len} for Pool Depth 3...")
-                
-                # Iterate nA
-                rem_min_A = win[0] - 1*pA['C'] # Minimal possible remainder
-                n_max_A = min(max_n - 2, int(np.floor(win[1]/pA['C']))) # Leave room for at least 1 B and 1 C
-                
-                for nA in range(1, n_max_A + 1):
-                    rem_after_A_min = win[0] - nA*pA['C']
-                    rem_after_A_max = win[1] - nA*pA['C']
-                    
-                    if rem_after_A_max <= 0: break # Overshot target
-
-                    if rem_after_A_max <= 0: break # Overshot target
-
-                    for j, pB in enumerate(subset):
-                        if j <= i: continue
-                        
-                        # Iterate nB
-                        n_max_B = min(max_n - nA - 1, int(np.floor(rem_after_A_max/pB['C'])))
-                        
-                        for nB in range(1, n_max_B + 1):
-                            rem_after_B_min = rem_after_A_min - nB*pB['C']
-                            rem_after_B_max = rem_after_A_max - nB*pB['C']
-                            
-                            if rem_after_B_max <= 0: break
-
-                            for k, pC in enumerate(subset):
-                                if k <= j: continue
-                                
-                                # Solve for nC directly
-                                # We need: rem_after_B_min <= nC*pC['C'] <= rem_after_B_max
-                                nC_min = max(1, int(np.ceil(rem_after_B_min / pC['C'])))
-                                nC_max = int(np.floor(rem_after_B_max / pC['C']))
-                                
-                                if nC_min > nC_max: continue
-                                
-                                # nC_min is our candidate count
-                                nC = nC_min
-                                
-                                # Check total count constraint
-                                if nA + nB + nC <= max_n:
-                                    tot = nA*pA['C'] + nB*pB['C'] + nC*pC['C']
-                                    
-                                    # Since we calculated nC based on win, tot should be in range, but check float precision
-                                    if win[0] <= tot <= win[1]:
-                                        gA = (nA/pA['E']) if pA['E'] > 0 else 999999
-                                        gB = (nB/pB['E']) if pB['E'] > 0 else 999999
-                                        gC = (nC/pC['E']) if pC['E'] > 0 else 999999
-                                        
-                                        sys_esr = 1.0 / (gA + gB + gC)
-                                        if sys_esr <= max_sys_esr:
-                                            # Construct Parts list
-                                            raw_parts = [
-                                                {'part': pA['P'], 'pkg': pA['K'], 'count': nA, 'L': pA['L'], 'W': pA['W'], 'H': pA['H']},
-                                                {'part': pB['P'], 'pkg': pB['K'], 'count': nB, 'L': pB['L'], 'W': pB['W'], 'H': pB['H']},
-                                                {'part': pC['P'], 'pkg': pC['K'], 'count': nC, 'L': pC['L'], 'W': pC['W'], 'H': pC['H']} 
-                                            ]
-                                            # Sort immediately
-                                            raw_parts.sort(key=lambda x: (-(x.get('L',0) * x.get('W',0)), x.get('part', '')))
-                                        
-                                            bom_str = " + ".join([f"{p['count']}x {p.get('pkg', '?')}" for p in raw_parts])
-                                            cfg_str = " + ".join([f"{p['count']}x {p['part']}" for p in raw_parts])
-
-                                            sols.append({
-                                                'Vol': nA*pA['V'] + nB*pB['V'] + nC*pC['V'], 'Cap': tot, 
-                                                'ESR': sys_esr, 'Area': nA*pA['A'] + nB*pB['A'] + nC*pC['A'],
-                                                'Height': max(pA['H'], pB['H'], pC['H']), 'Type': '3p', 
-                                                'BOM': bom_str,
-                                                'Cfg': cfg_str,
-                                                'Parts': raw_parts,
-                                                'Links': pA['Url']
-                                            })
-                            # Prune inner loop occasionally
-                            if len(sols) > MAX_SOLS * 3:
-                                sols = prune_solutions(sols)
-                    
-                    # Mid-loop prune
-                    if len(sols) > MAX_SOLS * 2:
-                        sols = prune_solutions(sols)
+            d3_span = 15 if conn_type == 3 else 8
+            warm = _warm_rows(subset_len, workers)
+            for i, pA in enumerate(subset[:warm]):
+                if out_of_time(80 + d3_span * (i / subset_len)): break
+                prog = 80 + int(d3_span * (i / subset_len))
+                if i % 5 == 0:
+                    yield from progress(prog, f"Scanning permutations {i+1}/{subset_len} for Pool Depth 3...")
+
+                # Only look for triples smaller than the bulkiest stack already on the frontier;
+                # anything larger would have to beat its ESR, which depth 2 already pushes down
+                vol_cap = min(archive.vol_bound(), np.nextafter(archive.max_vol(), np.inf))
+                hits = _depth3_block(ing, singles, i, win, max_n, max_sys_esr, vol_cap)
+                objs = _depth3_objectives(ing, i, hits)
+                keep = _mask_keep(mask, *_depth3_stacks(lab3, i, hits))
+                _insert_masked(archive, objs, lambda k, i=i, hits=hits: build3(i, *(h[k].item() for h in hits[:-1])), keep)
+
+            if warm < subset_len and not cut:
+                payload = {'ing': ing, 'singles': singles, 'win': win, 'max_n': max_n,
+                           'max_sys_esr': max_sys_esr, 'max_sols': MAX_SOLS, 'seed': archive.seed_state(),
+                           'mask': mask, 'lab': lab3, 'deadline': deadline}
+                # Shards start from the frontier and cap reached so far and tighten them locally
+                vol_cap = min(archive.vol_bound(), np.nextafter(archive.max_vol(), np.inf))
+                shards = [(rows, vol_cap) for rows in _shard_rows(range(warm, subset_len), workers)]
+                done_frac = warm / subset_len
+                ran = warm
+                for done, (objs, items, n_rows) in enumerate(_run_shards(workers, payload, _depth3_shard, shards)):
+                    archive.insert_batch(objs, lambda k, items=items: build3(*items[k]))
+                    ran += n_rows
+                    if token is not None and token.cancelled: break
+                    prog = 80 + int(d3_span * (done_frac + (1 - done_frac) * (done + 1) / len(shards)))
+                    yield from progress(prog, f"Merged {done + 1}/{len(shards)} Pool Depth 3 shards from {workers} workers...")
+                if ran < subset_len:
+                    cut.append(80 + d3_span * (ran / subset_len))
+
+        # Pool Depth 4+ Logic
+        if conn_type >= 4 and not out_of_time(88):
+            # Branch-and-bound over density-ordered ingredients; only stacks that could still make
+            # the returned top list by volume are expanded, so run time tracks the window, not n^k
+            deep_df = pd.concat([frame.head(n) for frame, n in zip(ranked, budget['deep'])]).drop_duplicates(subset=['P'])
+            # Zero-volume parts count as infinitely dense so the volume bound stays admissible
+            deep_df = deep_df.assign(D=np.where(deep_df['V'] > 0, deep_df['D'], np.inf))
+            deep_df = deep_df.sort_values(by='D', ascending=False, kind='stable')
+            deep = deep_df.to_dict('records')
+            deep_lab = deep_df.index.to_numpy()
+            ing = {k: deep_df[k].to_numpy(dtype=float) for k in ('C', 'V', 'E', 'A', 'H', 'D')}
+
+            yield from stage('deep', 88)
+            yield from progress(88, f"Branch-and-bound search for Pool Depth 4-{conn_type} ({len(deep)} candidates)...")
+
+            deep_len = len(deep)
+            for i in range(deep_len):
+                if out_of_time(88 + 7 * (i / deep_len)): break
+                prog = 88 + int(7 * (i / deep_len))
+                if i % 5 == 0:
+                    yield from progress(prog, f"Bounding stacks led by candidate {i+1}/{deep_len} for Pool Depth 4-{conn_type}...")
+
+                # Best-K bound: ranked by volume, a stack bulkier than the RESULT_LIMIT-th smallest cannot
+                # be returned; under any other ranking it still can. Always stay below the bulkiest entry
+                vol_cap = min(archive.vol_bound(), np.nextafter(archive.max_vol(), np.inf))
+                if params['rank_by'] == 'Vol':
+                    vol_cap = min(vol_cap, archive.kth_vol(RESULT_LIMIT))
+                hits = _deep_block(ing, i, win, max_n, max_sys_esr, 4, conn_type, vol_cap)
+                parts, counts, tot, sys_esr, vol = hits
+                used = parts >= 0
+                safe = np.where(used, parts, 0)
+                objs = np.column_stack([
+                    vol, sys_esr, (counts * ing['A'][safe]).sum(axis=1),
+                    np.where(used, ing['H'][safe], 0.0).max(axis=1), counts.sum(axis=1)
+                ])
+
+                def build(k, hits=hits):
+                    parts, counts, tot, sys_esr, vol = hits
+                    picked = [(deep_lab[j], n) for j, n in zip(parts[k].tolist(), counts[k].tolist()) if j >= 0]
+                    return StackRecord([j for j, _ in picked], [n for _, n in picked], table, tot[k].item(), sys_esr[k].item())
+
+                _insert_masked(archive, objs, build, _mask_keep(mask, np.where(used, deep_lab[safe], -1), counts))
+
+        # Local search (optional): beam of the best stacks so far, mutated toward deeper mixes.
+        # Its progress band follows the last exhaustive stage; tail is where the search part ends
+        ls_at = {1: 30, 2: 80}.get(conn_type, 95)
+        tail = ls_at + 2 if params['local_search'] else ls_at
+        if params['local_search'] and len(archive) and not out_of_time(ls_at):
+            yield from stage('local', ls_at)
+            ls_df = _pick_candidates(ranked, budget['local'], win, max_n)
+            # Pool depth is a hard limit on part types; local search only explores within it
+            max_types = min(params['local_search_types'], conn_type)
+            start = sorted((r for r in archive.items() if len(r.parts) <= max_types),
+                           key=lambda r: (getattr(r, params['rank_by']), r.Vol))[:32]
+            # Parts of the starting stacks join the ingredients so every stack maps onto them
+            extra = sorted({p for r in start for p in r.parts} - set(ls_df.index))
+            ls_df = pd.concat([ls_df, df_all.loc[extra]])
+            ls_lab = ls_df.index.to_numpy()
+            pos = {p: k for k, p in enumerate(ls_lab.tolist())}
+            check = None
+            if mask is not None:
+                check = lambda P, N: mask.ok(np.where(P >= 0, ls_lab[np.maximum(P, 0)], -1), N)
+            # Fixed seed: the same constraints always walk the same moves, so results stay cacheable
+            ls = LocalSearch({k: ls_df[k].to_numpy(dtype=float) for k in ('C', 'V', 'E', 'A', 'H')},
+                             [([pos[p] for p in r.parts], r.counts) for r in start], win, max_n, max_sys_esr,
+                             max_types, np.random.default_rng(0), params['rank_by'], check)
+            iters = params['local_search']
+            yield from progress(ls_at, f"Local search over {len(ls_lab)} candidates from {len(start)} stacks, up to {max_types} part types...")
+            for it in range(iters):
+                if out_of_time(ls_at + 2 * (it / iters)): break
+                if it % 25 == 0 and it:
+                    yield from progress(ls_at + int(2 * (it / iters)), f"Local search iteration {it}/{iters}...")
+                P, N, tot, vol, area, height, esr = ls.step(it / iters)
+                objs = np.column_stack([vol, esr, area, height, N.sum(axis=1)])
+
+                def build(k, P=P, N=N, tot=tot, esr=esr):
+                    picked = [(ls_lab[j], n) for j, n in zip(P[k].tolist(), N[k].tolist()) if j >= 0]
+                    return StackRecord([j for j, _ in picked], [n for _, n in picked], table, tot[k].item(), esr[k].item())
+
+                archive.insert_batch(objs, build)
+
+        # Exact Knapsack (optional): provable min-volume / min-area reference stacks
+        late = max(tail, 95)
+        if params['exact'] and not out_of_time(tail):
+            yield from stage('exact', late)
+            yield from progress(late, f"Solving exact knapsack DP over all {len(df_all)} candidates...")
+            # A DP cut short by the deadline makes the result partial like any other stage; a cancel ends the solve
+            yield from progress(late, self._exact_stage(df_all, params, archive, mask, stop=lambda: out_of_time(late)))
+
+        if token is not None and token.cancelled:
+            at = int(cut[0]) if cut else late
+            yield from stage(None, at)
+            yield _cancelled_event(at)
+            return
+
+        # A cut-short frontier is not a sound base for re-filtering later queries
+        if session_id is not None and not cut:
+            self._remember_session(session_id, {'params': params, 'df_proc': df_all, 'table': table, 'archive': archive,
+                                                 'classes': classes, 'mask': mask})
 
         # Final Sort and Limit
-        yield (95, sols, f"Consolidating identical configurations from {len(sols)} raw results...")
-        sols = deduplicate_solutions(sols)
-        
-        yield (98, sols, f"Optimization complete. Ranking {len(sols)} unique valid stacks...")
-        df_sol = pd.DataFrame(sols)
-        if df_sol.empty: 
-            yield (100, [], "Optimization complete: 0 results.")
+        yield from stage('rank', late)
+        yield from progress(late, f"Consolidating identical configurations from {len(archive)} raw results...")
+        yield from progress(98, f"Optimization complete. Ranking stacks by {params['rank_by']}...")
+        results = self._rank_results(archive.items(), table, params, classes, mask)
+        yield from stage(None, 100)
+        if cut:
+            # Share of the search's progress span (depth 1 start to tail) covered
+            explored = min(max((cut[0] - 15) / (tail - 15), 0.0), 0.999)
+            yield _result_event(results, f"Partial results: {explored:.0%} explored before the "
+                                         f"{params['time_budget_ms']:g} ms time budget ran out.", explored)
             return
+        if not results:
+            yield _result_event([], "Optimization complete: 0 results.")
+            return
+        yield _result_event(results, f"Running Bin Packing algorithm to optimize layout for solution stacks...")
+
+    def solve_batch(self, constraints_list, max_workers=None):
+        """
+        Solve many constraint sets, yielding (index, results, status) as each one finishes.
+
+        Rails sharing bias, frequency, temperature, rating and packages are filtered and derated
+        once over the union of their capacitance windows, and each takes its own rows from that.
+        Searches run on a thread pool (the numpy kernels release the GIL); results go through
+        the same result cache as solve_generator(). A rail that is malformed or fails yields
+        (index, [], "Error: ...") without stopping the others.
+        """
+        if self.df_library is None or self._missing_columns():
+            status = ("Error: Murata database is not loaded." if self.df_library is None else
+                      f"Error: Optimization failed. Column '{self._missing_columns()}' not found in library.")
+            for i in range(len(constraints_list)):
+                yield (i, [], status)
+            return
+
+        groups = {}
+        for i, constraints in enumerate(constraints_list):
+            try:
+                key = self.result_key(constraints)
+                params = self._unpack_constraints(constraints)
+            except (TypeError, ValueError) as e:
+                yield (i, [], f"Error: Invalid constraints ({e}).")
+                continue
+            cached = self.result_cache.get(key)
+            if cached is not None:
+                yield (i, cached, f"Loaded {len(cached)} cached results for these constraints.")
+                continue
+            if params['rank_by'] not in self.RANK_COLUMNS:
+                yield (i, [], f"Error: Cannot rank results by '{params['rank_by']}'.")
+                continue
+            shared = (params['bias'], params['target_freq'], params['min_temp'], params['min_rated_v'],
+                      tuple(sorted(params['allowed_pkgs'])))
+            groups.setdefault(shared, []).append((i, key, params))
+
+        def run(params, rows, derated):
+            deadline = time.time() + params['time_budget_ms'] / 1000.0 if params['time_budget_ms'] > 0 else None
+            last = _result_event([], "")
+            for last in self._search(self._candidate_table(rows, params, derated), params, track_top=False,
+                                     deadline=deadline):
+                pass
+            return last
+
+        pool = ThreadPoolExecutor(max_workers=max_workers)
+        try:
+            futures = {}
+            for rails in groups.values():
+                union = dict(rails[0][2], win=(min(p['win'][0] for _, _, p in rails),
+                                               max(p['win'][1] for _, _, p in rails)))
+                try:
+                    union_rows = self._prefilter(union)
+                    ce, esr = self._derate_rows(union_rows, union)
+                except Exception as e:
+                    for i, _, _ in rails:
+                        yield (i, [], f"Error: Optimization failed ({type(e).__name__}: {e}).")
+                    continue
+                for i, key, params in rails:
+                    # A rail's rows are a subset of the union's, both ascending
+                    rows = self._prefilter(params)
+                    pos = np.searchsorted(union_rows, rows)
+                    futures[pool.submit(run, params, rows, (ce[pos], esr[pos]))] = (i, key)
+            for fut in as_completed(futures):
+                i, key = futures[fut]
+                try:
+                    last = fut.result()
+                except Exception as e:
+                    yield (i, [], f"Error: Optimization failed ({type(e).__name__}: {e}).")
+                    continue
+                if last['type'] == 'result' and not last['partial']:
+                    self.result_cache.put(key, last['results'])
+                yield (i, last.get('results', []), last['status'])
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    def _reseat_stacks(self, recs, old_table, df_proc, cands, params):
+        """
+        (objectives, record) for each StackRecord over old_table still feasible with the parts
+        of df_proc (whose records are cands) at params.
+        """
+        pos = {r['P']: k for k, r in enumerate(cands)}
+        mask = self._impedance_mask(df_proc, params) if params['pdn_mask'] and recs else None
+        min_c, max_c = params['win']
+        for rec in recs:
+            rows = [pos.get(old_table[p]['P']) for p in rec.parts]
+            if None in rows:
+                continue
+            cap = sum(k * cands[r]['C'] for r, k in zip(rows, rec.counts))
+            esr = 1.0 / sum(k / cands[r]['E'] if cands[r]['E'] > 0 else 999999 for r, k in zip(rows, rec.counts))
+            if min_c <= cap <= max_c and esr <= params['max_sys_esr'] and rec.count() <= params['max_n']:
+                new = StackRecord(rows, rec.counts, cands, cap, esr)
+                if mask is not None and not self._record_passes(new, mask):
+                    continue
+                yield (new.Vol, esr, new.Area, new.Height, new.count()), new
+
+    def sweep_generator(self, constraints, biases):
+        """
+        Best stacks as a function of DC bias: yields (progress, table rows so far, status).
+
+        All bias points share one prefilter (at the lowest rating any of them needs) and one
+        derating pass over the whole grid. Points are solved in the given order, and each
+        search starts from the previous point's frontier re-evaluated at the new bias: the
+        candidate ordering barely moves between neighbours, so most of those stacks stay
+        feasible and tighten the pruning bounds from the start. One row per bias with the
+        Vol / Area / ESR minima over its frontier and the stack reaching each.
+        """
+        if self.df_library is None:
+            yield (100, [], "Error: Murata database is not loaded.")
+            return
+        missing = self._missing_columns()
+        if missing:
+            yield (100, [], f"Error: Optimization failed. Column '{missing}' not found in library.")
+            return
+        points = [self._unpack_constraints(dict(constraints, dc_bias=float(b))) for b in biases]
+        if not points:
+            yield (100, [], "Sweep complete: no bias points given.")
+            return
+
+        union = dict(points[0], min_rated_v=min(p['min_rated_v'] for p in points))
+        union_rows = self._prefilter(union)
+        yield (2, [], f"Derating {len(union_rows)} candidates at {len(points)} bias points...")
+        ce_grid = _derate_grid(self.dc_curves.take(union_rows), [p['bias'] for p in points])
+        esr = _esr_curves(self.esr_curves.take(union_rows), union['target_freq'])
 
-        df_sol = df_sol.sort_values(by='Vol').head(50)
-        yield (100, df_sol.to_dict('records'), f"Running Bin Packing algorithm to optimize layout for solution stacks...")
+        table, seeds, seed_table = [], [], None
+        for k, params in enumerate(points):
+            yield (5 + int(90 * k / len(points)), table, f"Solving bias point {k+1}/{len(points)} ({params['bias']:g} V)...")
+            rows = self._prefilter(params)
+            pos = np.searchsorted(union_rows, rows)
+            df_proc = self._candidate_table(rows, params, (ce_grid[k][pos], esr[pos]))
+            cands = df_proc.to_dict('records')
+            archive = ParetoArchive(self.MAX_SOLS)
+            for obj, rec in self._reseat_stacks(seeds, seed_table, df_proc, cands, params):
+                archive.insert(obj, rec)
+            for _ in self._search(df_proc, params, archive=archive, track_top=False):
+                pass
+            frontier = archive.items()
+            # Seed the next point with the stacks that set the volume bounds, not the whole frontier
+            seeds, seed_table = sorted(frontier, key=lambda rec: rec.Vol)[:self.RESULT_LIMIT], cands
 
-    def solve(self, constraints):
-        gen = self.solve_generator(constraints)
+            row = {'Bias': params['bias'], 'Candidates': len(df_proc), 'Stacks': len(frontier)}
+            for col in ('Vol', 'Area', 'ESR'):
+                best = min(frontier, key=lambda rec: (getattr(rec, col), rec.Vol)) if frontier else None
+                row[f"Min{col}"] = getattr(best, col) if best else None
+                row[f"Min{col}Cfg"] = best.present(cands)['Cfg'] if best else None
+            table.append(row)
+
+        yield (100, table, f"Sweep complete: {len(table)} bias points from {points[0]['bias']:g} V to {points[-1]['bias']:g} V.")
+
+    def sweep_bias(self, constraints, biases):
         last_val = []
-        for prog, val, status in gen:
+        for prog, val, status in self.sweep_generator(constraints, biases):
             last_val = val
         return last_val
+
+    def solve(self, constraints, session_id=None):
+        gen = self.solve_generator(constraints, session_id)
+        last_val = []
+        for event in gen:
+            last_val = event.get('results', last_val)
+        return last_val
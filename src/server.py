@@ -0,0 +1,290 @@
+"""
+Local HTTP/JSON solve service.
+
+Loads the library once and serves OptimizerService solves to other tools over plain HTTP:
+
+    python src/server.py --port 8765 --slots 2 --queue 8
+
+    POST /solve          constraints object -> {"ok", "status", "partial", "explored", "results",
+                                                "queue_ms", "latency_ms"}
+    POST /solve/stream   constraints object -> text/event-stream of solve_generator() events,
+                                               one "event: <type>" per event; the last one also
+                                               carries queue_ms and latency_ms
+    POST /cancel         {"session_id"} -> {"cancelled"}
+    GET  /health         library status
+    GET  /stats          slots, queue, rejected requests, latency percentiles and cancel_stats()
+
+A constraints object may carry a "session_id"; it is passed to solve_generator(), so a follow-up
+query on the same session can re-filter the previous search and POST /cancel can stop it. At most
+`slots` solves run at once and `queue` more wait for a slot; beyond that requests get a 503 with
+Retry-After instead of piling up. A streaming client that disconnects cancels its solve.
+Solves run on the request threads and share one OptimizerService, whose result cache and
+session store are locked. A request's "workers" is ignored: each solve runs in-process, so
+`slots` bounds the CPU the server uses.
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(os.path.dirname(__file__))
+from optimizer import OptimizerService, CancelToken
+
+DEFAULT_LIBRARY = os.path.join(os.path.dirname(__file__), "..", "data", "Murata_Unified_Library.csv")
+MAX_BODY_BYTES = 1 << 20
+# Completed requests kept for the /stats latency percentiles
+LATENCY_WINDOW = 1000
+
+
+def _json_default(o):
+    return o.item() if hasattr(o, 'item') else str(o)
+
+
+class SolvePool:
+    """
+    Admission control for solves: `slots` run at once and up to `queue` more wait in FIFO order.
+    admit() refuses immediately when both are full, which is the server's back-pressure.
+    """
+
+    def __init__(self, slots, queue):
+        self.slots = max(1, slots)
+        self.queue = max(0, queue)
+        self._cond = threading.Condition()
+        self._running = 0
+        self._waiting = deque()
+        self._latency = deque(maxlen=LATENCY_WINDOW)
+        self.served = 0
+        self.rejected = 0
+
+    def admit(self):
+        """Reserve a place; returns a ticket, or None when the pool and queue are full."""
+        with self._cond:
+            if self._running + len(self._waiting) >= self.slots + self.queue:
+                self.rejected += 1
+                return None
+            ticket = object()
+            self._waiting.append(ticket)
+            return ticket
+
+    def acquire(self, ticket):
+        """Block until ticket reaches the front of the queue and a slot is free."""
+        with self._cond:
+            while self._waiting[0] is not ticket or self._running >= self.slots:
+                self._cond.wait()
+            self._waiting.popleft()
+            self._running += 1
+            self._cond.notify_all()
+
+    def abandon(self, ticket):
+        """Give up a ticket from admit() that will never be acquired, so it does not block the queue."""
+        with self._cond:
+            try:
+                self._waiting.remove(ticket)
+            except ValueError:
+                pass
+            self._cond.notify_all()
+
+    def release(self, latency_ms=None):
+        with self._cond:
+            self._running -= 1
+            if latency_ms is not None:
+                self.served += 1
+                self._latency.append(latency_ms)
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            lat = sorted(self._latency)
+            running, waiting = self._running, len(self._waiting)
+
+        def pct(p):
+            return round(lat[min(len(lat) - 1, int(p * len(lat)))], 1) if lat else None
+
+        return {
+            'slots': self.slots, 'queue': self.queue, 'running': running, 'waiting': waiting,
+            'served': self.served, 'rejected': self.rejected,
+            'latency_ms': {'count': len(lat), 'p50': pct(0.5), 'p95': pct(0.95), 'max': round(lat[-1], 1) if lat else None}
+        }
+
+
+class SolveHandler(BaseHTTPRequestHandler):
+    server_version = "CapfinderSolve/1.0"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, fmt, *args):
+        if self.server.verbose:
+            super().log_message(fmt, *args)
+
+    def do_GET(self):
+        service = self.server.service
+        if self.path == "/health":
+            loaded = service.df_library is not None
+            self._send_json(200 if loaded else 503, {
+                'status': 'ok' if loaded else 'library not loaded',
+                'library_rows': len(service.df_library) if loaded else 0,
+                'library_hash': service.library_hash
+            })
+        elif self.path == "/stats":
+            self._send_json(200, dict(self.server.pool.stats(), cancel=service.cancel_stats()))
+        else:
+            self._send_json(404, {'error': f"Unknown path {self.path}."})
+
+    def do_POST(self):
+        body = self._read_json()
+        if body is None:
+            return
+        if self.path == "/cancel":
+            self._send_json(200, {'cancelled': self.server.service.cancel(body.get('session_id'))})
+        elif self.path in ("/solve", "/solve/stream"):
+            self._solve(body, stream=self.path == "/solve/stream")
+        else:
+            self._send_json(404, {'error': f"Unknown path {self.path}."})
+
+    def _solve(self, constraints, stream):
+        t0 = time.perf_counter()
+        pool = self.server.pool
+        ticket = pool.admit()
+        if ticket is None:
+            self._send_json(503, {'error': "Solve queue is full; retry later."}, {'Retry-After': '1'})
+            return
+
+        session_id = constraints.pop('session_id', None)
+        # Parallelism is across requests; a solve does not fork shard pools of its own
+        constraints['workers'] = 1
+        token = CancelToken()
+        try:
+            if stream:
+                self._start_stream()
+            pool.acquire(ticket)
+        except BaseException as e:
+            # The ticket must leave the queue, or every later solve waits behind it forever
+            pool.abandon(ticket)
+            if isinstance(e, (BrokenPipeError, ConnectionResetError)):
+                return
+            raise
+        queue_ms = (time.perf_counter() - t0) * 1000.0
+        connected = True
+        last = {'type': 'error', 'status': "Error: no result."}
+        try:
+            for event in self.server.service.solve_generator(constraints, session_id, token=token):
+                last = event
+                if connected and stream and event['type'] not in ('result', 'error', 'cancelled'):
+                    try:
+                        self._send_event(event)
+                    except (BrokenPipeError, ConnectionResetError):
+                        # The client went away; the solve stops at its next check
+                        connected = False
+                        token.cancel()
+        except Exception as e:
+            last = {'type': 'error', 'status': f"Error: {type(e).__name__}: {e}"}
+        finally:
+            latency_ms = (time.perf_counter() - t0) * 1000.0
+            pool.release(latency_ms if connected else None)
+
+        if not connected:
+            return
+        timing = {'queue_ms': round(queue_ms, 1), 'latency_ms': round(latency_ms, 1)}
+        if stream:
+            try:
+                self._send_event(dict(last, **timing))
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+            return
+        ok = last['type'] == 'result'
+        self._send_json(200 if ok else 422, dict({
+            'ok': ok, 'status': last['status'], 'partial': last.get('partial', False),
+            'explored': last.get('explored', 0.0), 'results': last.get('results', [])
+        }, **timing))
+
+    def _read_json(self):
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            if length < 0:
+                raise ValueError
+        except ValueError:
+            # Without a usable length the body cannot be skipped, so the connection cannot be reused
+            self.close_connection = True
+            self._send_json(400, {'error': "Invalid Content-Length header."}, {'Connection': 'close'})
+            return None
+        if length > MAX_BODY_BYTES:
+            # The body is left unread, so the connection cannot carry another request
+            self.close_connection = True
+            self._send_json(413, {'error': "Request body too large."}, {'Connection': 'close'})
+            return None
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+            if not isinstance(body, dict):
+                raise ValueError("expected a JSON object")
+        except ValueError as e:
+            self._send_json(400, {'error': f"Invalid JSON body ({e})."})
+            return None
+        return body
+
+    def _send_json(self, code, payload, headers=None):
+        data = json.dumps(payload, default=_json_default).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _start_stream(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        # No Content-Length, so the end of the stream is the end of the connection
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+
+    def _send_event(self, event):
+        data = json.dumps(event, default=_json_default)
+        self.wfile.write(f"event: {event['type']}\ndata: {data}\n\n".encode())
+        self.wfile.flush()
+
+
+class SolveServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, service, slots=2, queue=8, verbose=False):
+        super().__init__(address, SolveHandler)
+        self.service = service
+        self.pool = SolvePool(slots, queue)
+        self.verbose = verbose
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve capacitor-bank solves over local HTTP.")
+    parser.add_argument("--host", default="127.0.0.1", help="address to bind (default: localhost only)")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--library", default=DEFAULT_LIBRARY, help="unified library CSV")
+    parser.add_argument("--cache-dir", default=None, help="on-disk result cache")
+    parser.add_argument("--slots", type=int, default=os.cpu_count() or 1, help="solves run at once (default: CPU count)")
+    parser.add_argument("--queue", type=int, default=8, help="solves allowed to wait for a slot before 503s")
+    parser.add_argument("-v", "--verbose", action="store_true", help="log every request")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.library):
+        parser.error(f"library not found: {args.library}")
+
+    service = OptimizerService(args.library, result_cache_dir=args.cache_dir)
+    server = SolveServer((args.host, args.port), service, args.slots, args.queue, args.verbose)
+    print(f"Serving solves on http://{args.host}:{server.server_address[1]} "
+          f"({args.slots} slot(s), queue {args.queue}).", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
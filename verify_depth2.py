@@ -1,7 +1,7 @@
 
 import pandas as pd
 import numpy as np
-from src.optimizer import OptimizerService
+from src.optimizer import OptimizerService, _depth2_block
 
 class MockOptimizer(OptimizerService):
     def __init__(self):
@@ -42,34 +42,22 @@ def verify_depth2():
     print(f"Target: {constraints['min_cap']} - {constraints['max_cap']} F")
     print("Parts: A(0.3u), B(0.7u), C(0.1u)")
     
-    # Isolate the Depth 2 loop logic from optimizer.py
-    # Copy-pasting the relevant logic block for testing
-    
+    # Run the vectorized Depth 2 engine used by OptimizerService.solve_generator
     win = (constraints['min_cap'], constraints['max_cap'])
     max_n = constraints['max_count']
     max_sys_esr = constraints['max_sys_esr']
     sols = []
     
+    C = np.array([p['C'] for p in search_space])
+    E = np.array([p['E'] for p in search_space])
+    
     # --- DEPTH 2 LOGIC ---
     for i, pA in enumerate(search_space):
-        for pB in search_space:
-            if pA['P'] == pB['P']: continue
-            
-            for nA in range(1, max_n):
-                rem_min = win[0] - nA*pA['C']
-                rem_max = win[1] - nA*pA['C']
-                
-                if rem_min <= 0 and rem_max <= 0: break
-                
-                nB_min = max(1, int(np.ceil(max(0, rem_min) / pB['C'])))
-                nB_max = int(np.floor(rem_max / pB['C']))
-                
-                for nB in range(nB_min, nB_max + 1):
-                    if nA + nB <= max_n:
-                        tot_c = nA*pA['C'] + nB*pB['C']
-                        if win[0] <= tot_c <= win[1]:
-                            # Simplified append
-                            sols.append(f"{nA}x {pA['P']} + {nB}x {pB['P']} = {tot_c*1e6:.2f}uF")
+        j_arr, nA_arr, nB_arr, tot_arr, _ = _depth2_block(C, E, i, win, max_n, max_sys_esr)
+        for j, nA, nB, tot_c in zip(j_arr, nA_arr, nB_arr, tot_arr):
+            pB = search_space[j]
+            # Simplified append
+            sols.append(f"{nA}x {pA['P']} + {nB}x {pB['P']} = {tot_c*1e6:.2f}uF")
 
     print("\nSolutions Found:")
     for s in sols:
@@ -0,0 +1,187 @@
+import argparse
+import importlib.util
+import os
+import subprocess
+import sys
+import tempfile
+import numpy as np
+from src.optimizer import OptimizerService, ImpedanceMask
+
+DEFAULT_LIBRARY = os.path.join("data", "Murata_Unified_Library.csv")
+PDN_MASK = [(1e4, 3.0), (1e5, 0.3), (1e6, 0.03), (1e7, 0.03)]
+RTOL = 1e-9
+
+# Window/depth cases solved by both the reference and the current optimizer
+SOLVE_CASES = {
+    'depth1': dict(min_cap=9e-6, max_cap=11e-6, dc_bias=3.3, max_count=10, packages=['0402', '0603'], conn_type=1, target_freq=1e5),
+    'depth2': dict(min_cap=9e-6, max_cap=11e-6, dc_bias=3.3, max_count=10, packages=['0402', '0603'], conn_type=2, target_freq=1e5),
+    'depth2_esr': dict(min_cap=20e-6, max_cap=24e-6, dc_bias=5, max_count=12, packages=['0402', '0603', '0805'], conn_type=2, target_freq=1e6, max_esr=0.01),
+    'depth2_hv': dict(min_cap=1e-6, max_cap=1.5e-6, dc_bias=12, max_count=10, packages=['0402', '0603', '1206'], conn_type=2, target_freq=1e5),
+    'depth3': dict(min_cap=9e-6, max_cap=11e-6, dc_bias=3.3, max_count=10, packages=['0402', '0603'], conn_type=3, target_freq=1e5),
+    'depth3_tight': dict(target_cap=10, tolerance=0.5, dc_bias=3.3, max_count=12, packages=['0402', '0603', '0805'], conn_type=3),
+}
+
+# Edge cases only the current optimizer understands; they must finish with valid stacks
+EDGE_CASES = {
+    'exact_depth2': dict(SOLVE_CASES['depth2'], exact=True),
+    'exact_depth3': dict(SOLVE_CASES['depth3_tight'], exact=True),
+    'exact_empty_window': dict(min_cap=1e-8, max_cap=1.2e-8, dc_bias=3.3, target_freq=1e3, packages=['1210'], conn_type=2, exact=True),
+    'exact_max_count_200': dict(min_cap=9e-6, max_cap=1.2e-5, dc_bias=3.3, packages=['0402'], conn_type=2, max_count=200, exact=True, time_budget_ms=5000),
+    'max_count_1': dict(SOLVE_CASES['depth3'], max_count=1),
+    'max_count_2_depth3': dict(SOLVE_CASES['depth3'], max_count=2),
+    'time_budget': dict(SOLVE_CASES['depth3_tight'], time_budget_ms=50),
+    'pdn_depth2': dict(SOLVE_CASES['depth2'], pdn_mask=PDN_MASK),
+    'pdn_depth3': dict(SOLVE_CASES['depth3'], pdn_mask=PDN_MASK),
+    'pdn_exact': dict(SOLVE_CASES['depth2'], pdn_mask=PDN_MASK, exact=True),
+}
+
+
+def load_reference(rev):
+    """optimizer.py as of git revision rev, imported as a separate module."""
+    source = subprocess.run(["git", "show", f"{rev}:src/optimizer.py"], capture_output=True, text=True, check=True).stdout
+    path = os.path.join(tempfile.mkdtemp(), "reference_optimizer.py")
+    with open(path, "w") as f:
+        f.write(source)
+    spec = importlib.util.spec_from_file_location("reference_optimizer", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class StackChecker:
+    """Recomputes a result stack from the library with the reference per-part get_derated()/get_esr()."""
+
+    def __init__(self, ref):
+        self.ref = ref
+        self.rows = {(r['MfrPartName'], r['Package']): r for _, r in ref.df_library.iterrows()}
+
+    def problems(self, stack, c):
+        if 'min_cap' in c:
+            lo, hi = c['min_cap'], c['max_cap']
+        else:
+            target, tol = c['target_cap'] * 1e-6, c['tolerance'] / 100.0
+            lo, hi = target * (1 - tol), target * (1 + tol)
+        bias, freq = c.get('dc_bias', 5.0), c.get('target_freq', 100000)
+        rows = [(self.rows[(p['part'], p['pkg'])], p['count']) for p in stack['Parts']]
+        cap = sum(n * self.ref.get_derated(r, bias) for r, n in rows)
+        vol = sum(n * float(r['Volume_mm3']) for r, n in rows)
+        esr = [self.ref.get_esr(r, freq) for r, _ in rows]
+        if len(rows) == 1:
+            esr = esr[0] / rows[0][1]
+        else:
+            # Same stand-in the reference search uses for a part without an ESR curve
+            esr = 1.0 / sum(n / e if e > 0 else 999999 for (_, n), e in zip(rows, esr))
+        out = []
+        if not np.isclose(cap, stack['Cap'], rtol=1e-6):
+            out.append(f"Cap {stack['Cap']:.6g} != {cap:.6g}")
+        if not np.isclose(vol, stack['Vol'], rtol=1e-6):
+            out.append(f"Vol {stack['Vol']:.6g} != {vol:.6g}")
+        if not np.isclose(esr, stack['ESR'], rtol=1e-6):
+            out.append(f"ESR {stack['ESR']:.6g} != {esr:.6g}")
+        if not lo * (1 - RTOL) <= cap <= hi * (1 + RTOL):
+            out.append(f"Cap {cap:.6g} outside [{lo:.6g}, {hi:.6g}]")
+        if esr > c.get('max_esr', 1.0) * (1 + RTOL):
+            out.append(f"ESR {esr:.6g} over the limit")
+        if sum(n for _, n in rows) > c.get('max_count', 25):
+            out.append("too many parts")
+        if c.get('pdn_mask') and not self.meets_mask(rows, c):
+            out.append("|Z| over the PDN mask")
+        return out
+
+    def meets_mask(self, rows, c):
+        mask = ImpedanceMask(c['pdn_mask'])
+        w = 2 * np.pi * mask.freqs
+        Y = np.zeros(len(w), dtype=complex)
+        for r, n in rows:
+            C = self.ref.get_derated(r, c.get('dc_bias', 5.0))
+            R = np.array([self.ref.get_esr(r, f) for f in mask.freqs])
+            srf, nominal = float(r['SRF_MHz']) * 1e6, float(r['Capacitance'])
+            L = 1.0 / ((2 * np.pi * srf) ** 2 * nominal) if srf > 0 and nominal > 0 else 0.0
+            Y += n / (R + 1j * (w * L - 1.0 / (w * C)))
+        return bool(np.all(np.abs(1.0 / Y) <= mask.limit * (1 + 1e-6)))
+
+
+def verify_curves(ref, new):
+    """Batched derating/ESR over the whole library against the scalar reference, row by row."""
+    failed = 0
+    df_ref = ref.df_library
+    for bias, freq in [(0.0, 1e2), (3.3, 1e5), (12.0, 1e6), (1000.0, 1e10)]:
+        c_new = new.get_derated_batch(new.df_library, bias)
+        e_new = new.get_esr_batch(new.df_library, freq)
+        c_ref = np.array([ref.get_derated(r, bias) for _, r in df_ref.iterrows()], dtype=float)
+        e_ref = np.array([ref.get_esr(r, freq) for _, r in df_ref.iterrows()], dtype=float)
+        bad = ~(np.isclose(c_new, c_ref, rtol=RTOL, atol=0) & np.isclose(e_new, e_ref, rtol=RTOL, atol=0))
+        failed += report(f"curves bias={bias:g} V f={freq:g} Hz", [f"{bad.sum()} of {len(bad)} rows differ"] if bad.any() else [])
+    return failed
+
+
+def solve(svc, c):
+    try:
+        events = list(svc.solve_generator(dict(c)))
+    except Exception as e:
+        return None, f"raised {type(e).__name__}: {e}"
+    last = events[-1]
+    if last['type'] != 'result':
+        return None, last['status']
+    return last['results'], None
+
+
+def report(name, problems, note=""):
+    print(f"{'PASS' if not problems else 'FAIL'}  {name:<22} {note}")
+    for p in problems[:5]:
+        print(f"      {p}")
+    return 1 if problems else 0
+
+
+def verify_equivalence(library, rev):
+    print(f"Library: {library}  |  Reference: {rev}")
+    if not os.path.exists(library):
+        print("Library file not found.")
+        return 1
+
+    ref_mod = load_reference(rev)
+    ref = ref_mod.OptimizerService(library)
+    new = OptimizerService(library, use_cache=False, result_cache_size=0)
+    checker = StackChecker(ref)
+    failed = verify_curves(ref, new)
+
+    best = {}
+    for name, c in SOLVE_CASES.items():
+        old = ref.solve(dict(c))
+        res, err = solve(new, c)
+        if err:
+            failed += report(name, [err])
+            continue
+        problems = [f"#{i}: {p}" for i, s in enumerate(res) for p in checker.problems(s, c)]
+        old_best = min((s['Vol'] for s in old), default=np.inf)
+        best[name] = min((s['Vol'] for s in res), default=np.inf)
+        # Pruning may change which stacks are listed, but never lose the smallest one
+        if best[name] > old_best * (1 + RTOL):
+            problems.append(f"best Vol {best[name]:.6g} worse than reference {old_best:.6g}")
+        same = [(s['Cfg'], s['Vol']) for s in old] == [(s['Cfg'], s['Vol']) for s in res]
+        failed += report(name, problems, f"{len(old)}/{len(res)} stacks, identical={same}")
+
+    for name, c in EDGE_CASES.items():
+        res, err = solve(new, c)
+        if err:
+            failed += report(name, [err])
+            continue
+        problems = [f"#{i}: {p}" for i, s in enumerate(res) for p in checker.problems(s, c)]
+        # An exact stage without a PDN mask keeps the true minimum, so it cannot lose to the heuristic
+        base = next((k for k, v in SOLVE_CASES.items() if c.items() >= v.items()), None)
+        if c.get('exact') and not c.get('pdn_mask') and base in best and res:
+            if res[0]['Vol'] > best[base] * (1 + RTOL):
+                problems.append(f"exact best Vol {res[0]['Vol']:.6g} worse than heuristic {best[base]:.6g}")
+        failed += report(name, problems, f"{len(res)} stacks")
+
+    print(f"\n{'All checks passed.' if not failed else f'{failed} check(s) failed.'}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    root = subprocess.run(["git", "rev-list", "--max-parents=0", "HEAD"], capture_output=True, text=True).stdout.split()
+    parser = argparse.ArgumentParser(description="Compare the optimizer against a reference revision on the unified library.")
+    parser.add_argument("library", nargs="?", default=DEFAULT_LIBRARY)
+    parser.add_argument("--rev", default=root[0] if root else "HEAD", help="reference revision (default: the first commit)")
+    args = parser.parse_args()
+    sys.exit(verify_equivalence(args.library, args.rev))